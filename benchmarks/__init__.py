@@ -0,0 +1 @@
+'''Reproducible performance benchmarks for the tender pipeline (see run.py).'''
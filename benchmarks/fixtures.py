@@ -0,0 +1,123 @@
+'''
+Benchmark inputs: portal listing pages, synthetic tender PDFs and product
+catalogs of configurable size.
+
+Listing pages recorded from the real TENDER_SOURCES (`python -m
+benchmarks.run --record`) are stored in benchmarks/fixtures/ and served
+as-is; portals without a recording get a synthetic page in the same
+layout, so the suite also runs offline.
+'''
+import os
+import random
+import re
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+_WORDS = (
+    "supply installation commissioning of interior exterior emulsion paint primer waterproof "
+    "de-rusting enamel cable wire electrical copper armoured lt ht panel building hospital "
+    "school road bridge repair maintenance annual rate contract district block civil works"
+).split()
+_BUYERS = ("PWD", "CPWD", "NHAI", "BHEL", "IOCL", "Railways", "Municipal Corporation", "Health Dept")
+_PLACES = ("Lucknow", "Kanpur", "New Delhi", "Mumbai", "Nagpur", "Bengaluru", "Chennai", "Kolkata")
+
+
+def fixture_name(portal_url):
+    '''File name of the recorded listing page for a TENDER_SOURCES entry.'''
+    parts = urlparse(portal_url)
+    slug = re.sub(r"[^a-zA-Z0-9]+", "_", parts.netloc + parts.path + "_" + parts.query).strip("_")
+    return slug[:120] + ".html"
+
+
+def load_recorded(portal_url):
+    path = os.path.join(FIXTURE_DIR, fixture_name(portal_url))
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    return None
+
+
+def _title(rng):
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 14))).capitalize()
+
+
+def listing_html(portal_path, page=1, rows=60, pages=5, seed=0):
+    '''
+    Synthetic listing page in the eProcure/CPPP table layout (number, linked
+    title, buyer, location, published, closing date), nested inside a
+    layout table like the NIC portals, with a pager linking to `pages` pages.
+    Deadlines fall inside the 3-month window on early pages and after it on
+    the last page.
+    '''
+    rng = random.Random(f"{portal_path}:{page}:{seed}")
+    today = datetime.now()
+    body = []
+    for i in range(rows):
+        n = (page - 1) * rows + i
+        days = rng.randint(5, 85) if page < pages else rng.randint(100, 200)
+        deadline = (today + timedelta(days=days)).strftime("%d-%m-%Y")
+        body.append(
+            f"<tr><td>{today.year}_{rng.choice(_BUYERS)[:4].upper()}_{n:06d}_1</td>"
+            f"<td><a href='/docs/{n % 50}.pdf'>{_title(rng)}</a></td>"
+            f"<td>{rng.choice(_BUYERS)}</td><td>{rng.choice(_PLACES)}</td>"
+            f"<td>{today.strftime('%d-%m-%Y')}</td><td>{deadline}</td></tr>"
+        )
+    pager = " ".join(f"<a href='{portal_path}?pageno={p}'>{p}</a>" for p in range(1, pages + 1) if p != page)
+    if page < pages:
+        pager += f" <a href='{portal_path}?pageno={page + 1}'>Next</a>"
+    return (
+        "<html><head><title>Latest Active Tenders</title></head><body>"
+        "<table class='layout'><tr><td><table id='table' class='list_table'>"
+        "<tr><th>Tender ID</th><th>Title</th><th>Organisation</th><th>Location</th>"
+        "<th>Published</th><th>Closing Date</th></tr>"
+        + "".join(body)
+        + f"</table></td></tr></table><div class='pager'>{pager}</div></body></html>"
+    ).encode("utf-8")
+
+
+def make_pdf(n_pages, lines_per_page=45, seed=0):
+    '''A text-only PDF of `n_pages` pages of BOQ-like lines, built without any PDF library.'''
+    rng = random.Random(seed)
+    objs = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(n_pages):
+        lines = " ".join(
+            f"({p * lines_per_page + i + 1}. {_title(rng)} qty {rng.randint(1, 500)} nos) '"
+            for i in range(lines_per_page)
+        )
+        stream = f"BT /F1 9 Tf 36 806 Td 11 TL {lines} ET".encode("latin-1", "replace")
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objs.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objs)
+        )
+        kids.append(len(objs))
+    objs[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objs[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % n_pages
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+def make_catalog(size, seed=0):
+    '''`size` product descriptions in the style of product_db.'''
+    rng = random.Random(seed)
+    kinds = ("Interior Emulsion Paint", "Exterior Emulsion Paint", "Waterproof Primer", "De-Rusting Primer",
+             "Enamel Paint", "Copper Cable", "Armoured Cable", "PVC Wire")
+    extras = ("ISI certified", "Low VOC", "scrub resistance >500 cycles", "5-year warranty",
+              "water-based", "oil-based alkyd", "IS 694", "IS 1554", "flame retardant", "exterior application")
+    return [
+        f"{rng.choice(kinds)} – {rng.choice(('White', 'Grey', 'Green', 'Red', 'Black'))}, "
+        f"{rng.choice((1, 4, 5, 10, 20))}{rng.choice(('L', 'kg', 'm', 'sq.mm'))}, "
+        + ", ".join(rng.sample(extras, 3)) + f", SKU {i:06d}"
+        for i in range(size)
+    ]
@@ -0,0 +1,242 @@
+'''
+Per-stage performance benchmarks against a local stand-in for the portals.
+
+    python -m benchmarks.run                      # run and compare with baseline.json
+    python -m benchmarks.run --save-baseline      # run and store the results as the baseline
+    python -m benchmarks.run --catalog-size 50000 --pdf-pages 400
+    python -m benchmarks.run --record             # refresh fixtures from the live TENDER_SOURCES
+
+Each stage reports median latency over --repeats runs, throughput and the
+peak Python heap (tracemalloc, measured in a separate run; work done in
+process-pool children is not included). A stage regresses when its
+latency or peak memory exceeds the baseline by more than --tolerance; the
+exit status is then 1. Baselines are machine-specific: record one on the
+machine you compare on.
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def load_package(workdir):
+    '''Import rfp_helper with its relative data files (store, caches) under `workdir`.'''
+    os.chdir(workdir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import rfp_helper
+    return rfp_helper
+
+
+def measure(fn, repeats):
+    '''Run fn `repeats` times; return (median seconds, items from the last run, peak heap MB).'''
+    times, items = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        items = fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), items, peak / 1e6
+
+
+def build_stages(rfp, base_url, stand_in, args):
+    from benchmarks import fixtures
+    from urllib.parse import urlparse
+
+    sources = list(rfp.config.TENDER_SOURCES)
+    local_sources = [base_url + urlparse(p).path + ("?" + urlparse(p).query if urlparse(p).query else "")
+                     for p in sources]
+    listing = fixtures.listing_html("/eprocure/bench", rows=args.listing_rows, pages=1)
+    catalog = fixtures.make_catalog(args.catalog_size)
+    pdf_bytes = stand_in.pdf
+    pdf_path = os.path.abspath("bench.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(pdf_bytes)
+    titles = [fixtures._title(__import__("random").Random(i)) for i in range(args.batch_size)]
+    rfp.matching.get_product_index(catalog)  # warm: query stages measure lookups, not the fit
+    # tenders to search, indexed as a scrape would store them
+    rfp.upsert_tenders([{"Tender Title": t, "Tender Number": f"BENCH/{i}", "Buyer": "Bench", "Deadline": "16-11-2030"}
+                        for i, t in enumerate(titles)])
+
+    def scrape():
+        rfp.config.TENDER_SOURCES = local_sources
+        rfp.config.HTTP_CACHE_TTL = 0
+        return len(rfp.scrape_tenders(incremental=False))
+
+    def parse_rows():
+        return sum(1 for _ in rfp.extract_rows(rfp.iter_listing_rows(listing), base_url + "/eprocure/bench"))
+
+    def download():
+        rfp.config.DOC_STORE_DIR = tempfile.mkdtemp(prefix="docs-", dir=".")
+        path = rfp.download_rfp(base_url + "/docs/0.pdf", refresh=True)
+        return os.path.getsize(path) if path else 0
+
+    def pdf_preview():
+        return len(rfp.extract_rfp_text_from_pdf_buffer(pdf_bytes))
+
+    def pdf_full():
+        rfp.extract_pdf_text_parallel(pdf_path)
+        return args.pdf_pages
+
+    def boq_items():
+        return len(rfp.match_line_items(rfp.iter_line_items(pdf_path, workers=rfp.config.PDF_WORKERS), catalog))
+
+    def index_build():
+        rfp.matching.build_product_index(catalog)
+        return len(catalog)
+
+    def relevance():
+        rfp.check_relevance(" ".join(titles[:20]), catalog)
+        return 1
+
+    def batch():
+        rfp.batch_relevance(titles, catalog)
+        return len(titles)
+
+    def search():
+        for t in titles[:20]:
+            rfp.search_scores(" ".join(t.split()[:3]))
+        return 20
+
+    def score_dedup():
+        import pandas as pd
+        df = pd.DataFrame({
+            "Tender Title": [titles[i % len(titles)] for i in range(args.score_rows)],
+            "Tender Number": [str(i % (args.score_rows // 2 or 1)) for i in range(args.score_rows)],
+            "Deadline": ["16-11-2030"] * args.score_rows,
+        })
+        df["Score"] = rfp.score_tenders(df)
+        return len(rfp.dedup_tenders(df))
+
+    return {
+        "scrape_tenders": (scrape, "tenders"),
+        "parse_extract_rows": (parse_rows, "rows"),
+        "download_rfp": (download, "bytes"),
+        "pdf_preview": (pdf_preview, "chars"),
+        "pdf_full_parallel": (pdf_full, "pages"),
+        "boq_line_items": (boq_items, "items"),
+        "product_index_build": (index_build, "products"),
+        "check_relevance": (relevance, "queries"),
+        "batch_relevance": (batch, "titles"),
+        "search_tenders": (search, "queries"),
+        "score_dedup": (score_dedup, "rows"),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for stage, res in results.items():
+        base = baseline.get(stage)
+        if not base:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if base.get(metric) and res[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{stage}: {metric} {res[metric]:.4g} vs baseline {base[metric]:.4g}")
+    return regressions
+
+
+def record_fixtures(rfp):
+    import requests
+    from benchmarks import fixtures
+    os.makedirs(fixtures.FIXTURE_DIR, exist_ok=True)
+    for portal in rfp.config.TENDER_SOURCES:
+        try:
+            resp = requests.get(portal, headers=rfp.config.HEADERS, timeout=30)
+            resp.raise_for_status()
+        except Exception as e:
+            print(f"skip {portal}: {e}")
+            continue
+        path = os.path.join(fixtures.FIXTURE_DIR, fixtures.fixture_name(portal))
+        with open(path, "wb") as f:
+            f.write(resp.content)
+        print(f"recorded {portal} -> {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--pdf-pages", type=int, default=300)
+    parser.add_argument("--listing-rows", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--score-rows", type=int, default=100000)
+    parser.add_argument("--stages", nargs="*", help="run only these stages")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="also write the results JSON here")
+    parser.add_argument("--record", action="store_true", help="record live portal pages as fixtures and exit")
+    args = parser.parse_args(argv)
+    args.baseline = os.path.abspath(args.baseline)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    workdir = tempfile.mkdtemp(prefix="rfp-bench-")
+    rfp = load_package(workdir)
+    if args.record:
+        record_fixtures(rfp)
+        return 0
+
+    from benchmarks.server import PortalStandIn
+    stand_in = PortalStandIn(rfp.config.TENDER_SOURCES, pdf_pages=args.pdf_pages)
+    base_url = stand_in.start()
+    try:
+        stages = build_stages(rfp, base_url, stand_in, args)
+        results = {}
+        for name, (fn, unit) in stages.items():
+            if args.stages and name not in args.stages:
+                continue
+            seconds, items, peak_mb = measure(fn, args.repeats)
+            results[name] = {
+                "seconds": round(seconds, 6),
+                "items": items,
+                "unit": unit,
+                "throughput": round(items / seconds, 2) if seconds else None,
+                "peak_mb": round(peak_mb, 3),
+            }
+            print(f"{name:<22} {seconds * 1000:>10.1f} ms {results[name]['throughput'] or 0:>14,.1f} {unit}/s"
+                  f" {peak_mb:>9.1f} MB")
+    finally:
+        stand_in.stop()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "catalog_size": args.catalog_size,
+            "pdf_pages": args.pdf_pages,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare with (run with --save-baseline)")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f).get("stages", {}), args.tolerance)
+    for line in regressions:
+        print("REGRESSION", line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+'''Local HTTP stand-in for the tender portals and their documents.'''
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks import fixtures
+
+
+class PortalStandIn:
+    '''
+    Serves listing pages for each portal path (recorded fixture when one
+    exists, synthetic otherwise) and synthetic PDFs under /docs/<n>.pdf.
+    '''
+
+    def __init__(self, portals, rows_per_page=60, pages=5, pdf_pages=300):
+        self.recorded = {urlparse(p).path: fixtures.load_recorded(p) for p in portals}
+        self.rows_per_page = rows_per_page
+        self.pages = pages
+        self.pdf_pages = pdf_pages
+        self._pdf = None
+        self._httpd = None
+
+    @property
+    def pdf(self):
+        if self._pdf is None:
+            self._pdf = fixtures.make_pdf(self.pdf_pages)
+        return self._pdf
+
+    def body_for(self, path, query):
+        if path.startswith("/docs/"):
+            return "application/pdf", self.pdf
+        recorded = self.recorded.get(path)
+        page = int(parse_qs(query).get("pageno", ["1"])[0])
+        if recorded is not None and page == 1:
+            return "text/html; charset=utf-8", recorded
+        return "text/html; charset=utf-8", fixtures.listing_html(path, page, self.rows_per_page, self.pages)
+
+    def start(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = urlparse(self.path)
+                content_type, body = stand_in.body_for(parts.path, parts.query)
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
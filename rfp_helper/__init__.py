@@ -0,0 +1,50 @@
+'''
+OrchestraRFP as a library: the scrape -> download -> extract -> match ->
+price pipeline without Streamlit. Public names are resolved on first use,
+so `import rfp_helper` is cheap and each stage pulls in its heavy
+dependencies (pandas, bs4/lxml, pdfplumber, openpyxl, scikit-learn) only
+when it runs. `python -m rfp_helper --help` lists the CLI commands.
+'''
+import importlib
+
+_EXPORTS = {
+    "boq": ["extract_boq", "iter_line_items", "match_line_items"],
+    "config": ["product_db"],
+    "dates": ["parse_date_flex", "parse_deadlines", "is_due_within_3_months"],
+    "discover": ["data_age", "format_age", "last_refresh_error", "refresh_in_progress", "request_refresh",
+                 "sales_agent_discover"],
+    "documents": ["document_url", "download_rfp", "extract_pdf_text_parallel", "extract_rfp_text_from_pdf",
+                  "extract_rfp_text_from_pdf_buffer", "iter_spreadsheet_chunks", "iter_spreadsheet_rows"],
+    "fetch": ["http_cache_stats", "safe_get"],
+    "jobs": ["ensure_worker", "job_key", "job_status", "prefetch_top_tenders", "queue_summary", "run_worker", "submit_job"],
+    "listing": ["extract_metadata_from_row", "extract_rows", "extractor_stats", "iter_listing_rows"],
+    "matching": ["analyze_document", "batch_relevance", "check_relevance", "is_spreadsheet", "record_document_fit",
+                 "refresh_product_fit"],
+    "metrics": ["latency_percentiles", "metrics_prometheus", "read_metric_events", "run_summaries"],
+    "pipeline": ["analyze_and_price", "process_tender", "run_batch", "run_pipeline"],
+    "pricing": ["DUMMY_PRODUCT_PRICES", "DUMMY_TEST_PRICES", "export_prices", "format_inr", "get_price_index",
+                "price_line_items", "price_styler", "pricing_agent_build", "recommendation_table"],
+    "scoring": ["dedup_tenders", "load_score_weights", "merge_near_duplicates", "rescore_store",
+                "save_score_weights", "score_tenders"],
+    "scrape": ["scrape_tenders"],
+    "search": ["apply_facets", "facet_counts", "index_document_text", "search_scores", "search_tenders"],
+    "store": ["load_analysis", "prime_cache", "query_tenders", "store_has_tenders", "tender_key", "upsert_tenders"],
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_MODULE_OF)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return importlib.import_module(f".{name}", __name__)
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
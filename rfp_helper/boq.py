@@ -0,0 +1,229 @@
+'''
+Bill of quantities: line items pulled from the whole tender document
+(pdfplumber tables page by page, text lines on pages without tables, or
+spreadsheet rows) and batch-matched against the product catalog, each
+with its best product, SKU and match score.
+'''
+import re
+from itertools import islice
+
+from . import config
+from .documents import iter_spreadsheet_rows, pdf_source
+from .matching import analysis_cache_get, analysis_cache_put, batch_relevance, catalog_version, document_sha, \
+    is_spreadsheet, product_sku
+from .metrics import count, span
+from .util import process_pool
+
+BOQ_VERSION = "1"             # bump when extraction changes, so cached line items are redone
+
+# Header cell words per line-item field, checked in this order ("Item Description"
+# is a description, "Unit Rate" a rate)
+BOQ_HEADER_WORDS = (
+    ("description", ("description", "particular", "specification", "name of item", "item of work")),
+    ("quantity", ("qty", "quantity")),
+    ("rate", ("rate", "price", "amount")),
+    ("unit", ("unit", "uom")),
+    ("item", ("s.no", "s. no", "sl", "sr", "item no", "item")),
+)
+
+BOQ_UNITS = (r"nos?|no\.|numbers?|sets?|pairs?|kgs?|mt|tonnes?|l|ltrs?|litres?|liters?|m|mtrs?|metres?|meters?|rm|rmt|km|"
+             r"sq\.?\s?m|sqm|sq\.?\s?ft|sft|cu\.?\s?m|cum|each|ea|pcs|lot|ls|job|drums?|rolls?|coils?|bags?")
+
+# Numbered text line ending in a quantity and unit, e.g. "12. Waterproof primer, 5L qty 40 nos"
+LINE_ITEM_RE = re.compile(
+    r"^\s*(\d{1,4}(?:\.\d{1,3})*)[.)]?\s+(.+?)[\s,;:-]+(?:qty\.?|quantity)?\s*:?\s*(\d[\d,]*(?:\.\d+)?)\s*"
+    r"(" + BOQ_UNITS + r")\.?\s*$",
+    re.I,
+)
+ITEM_NO_RE = re.compile(r"^\(?[a-z]?\d{1,4}(?:\.\d{1,3})*[.)]?$", re.I)
+UNIT_RE = re.compile(r"^(?:" + BOQ_UNITS + r")\.?$", re.I)
+
+def _quantity(cell):
+    try:
+        return float(cell.replace(",", ""))
+    except (AttributeError, ValueError):
+        return None
+
+def _header_columns(cells):
+    '''Column of each field ({"description": 2, ...}) if `cells` is a BOQ header row, else None.'''
+    cols = {}
+    for i, cell in enumerate(cells):
+        c = cell.lower()
+        for field, words in BOQ_HEADER_WORDS:
+            if field not in cols and any(w in c for w in words):
+                cols[field] = i
+                break
+    return cols if "description" in cols and len(cols) >= 2 else None
+
+def _row_item(cells, header):
+    '''A line item dict from one table row, laid out per `header` or guessed; None if it is not one.'''
+    def cell(field):
+        i = header.get(field) if header else None
+        return cells[i] if i is not None and i < len(cells) else ""
+
+    if header:
+        description, quantity, unit, item = cell("description"), _quantity(cell("quantity")), cell("unit"), cell("item")
+    else:
+        # longest cell with words is the description; the first number after it the quantity
+        d = max(range(len(cells)), key=lambda i: len(cells[i]) if re.search(r"[a-z]{3}", cells[i], re.I) else -1)
+        description, quantity, unit = cells[d], None, ""
+        for i in range(d + 1, len(cells)):
+            quantity = _quantity(cells[i])
+            if quantity is not None:
+                unit = cells[i + 1] if i + 1 < len(cells) and UNIT_RE.match(cells[i + 1]) else ""
+                break
+        item = cells[0] if d > 0 and ITEM_NO_RE.match(cells[0]) else ""
+    description = " ".join(description.split())
+    if len(description) < config.BOQ_MIN_DESCRIPTION or description.lower().startswith(("total", "grand total")):
+        return None
+    # headings and preamble carry no quantity; accept those only where the table has no quantity column
+    if quantity is None and (not header or "quantity" in header):
+        return None
+    return {"Item": item, "Description": description, "Quantity": quantity, "Unit": unit}
+
+def _table_items(rows, where, header):
+    '''Line items of one table's rows; returns (items, header) so a table split across pages keeps its header.'''
+    items = []
+    for n, row in enumerate(rows, 1):
+        cells = [" ".join(str(c).split()) if c is not None else "" for c in row]
+        if not any(cells):
+            continue
+        found = _header_columns(cells)
+        if found:
+            header = found
+            continue
+        item = _row_item(cells, header)
+        if item:
+            items.append({"Page/Sheet": where, "Row": n, **item})
+    return items, header
+
+def _page_parts(page):
+    '''
+    Line-item material of one pdfplumber page: ("table", rows) for each
+    ruled table, or a single ("text", items) of numbered lines ending in a
+    quantity and unit when the page has none.
+    '''
+    tables = page.extract_tables() if page.lines or page.rects else []
+    if tables:
+        return [("table", table) for table in tables]
+    items = []
+    for row, line in enumerate((page.extract_text() or "").splitlines(), 1):
+        m = LINE_ITEM_RE.match(line)
+        if m and len(m.group(2).strip()) >= config.BOQ_MIN_DESCRIPTION:
+            items.append({"Row": row, "Item": m.group(1), "Description": m.group(2).strip(),
+                          "Quantity": _quantity(m.group(3)), "Unit": m.group(4)})
+    return [("text", items)]
+
+def _pdf_parts_range(pdf_path, start, stop):
+    '''(page_number, parts) for pages [start, stop); runs in a worker process.'''
+    import pdfplumber
+    out = []
+    with pdfplumber.open(pdf_path) as doc:
+        for n in range(start, stop):
+            page = doc.pages[n]
+            try:
+                out.append((n + 1, _page_parts(page)))
+            except Exception:
+                out.append((n + 1, []))
+            finally:
+                page.close()
+    return out
+
+def _iter_pdf_parts(pdf, workers):
+    import pdfplumber
+    with pdfplumber.open(pdf_source(pdf)) as doc:
+        n_pages = len(doc.pages)
+        if workers <= 1 or not isinstance(pdf, str) or n_pages <= config.PDF_PAGES_PER_TASK:
+            for n, page in enumerate(doc.pages, 1):
+                try:
+                    parts = _page_parts(page)
+                finally:
+                    page.close()
+                yield n, parts
+            return
+    ranges = [(s, min(s + config.PDF_PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, config.PDF_PAGES_PER_TASK)]
+    pool = process_pool(workers)
+    try:
+        # map() hands results back in page order, so headers carry over as in a sequential read
+        for pages in pool.map(_pdf_parts_range, *zip(*[(pdf, s, e) for s, e in ranges])):
+            yield from pages
+    finally:
+        # a consumer that stops early (BOQ_MAX_ITEMS) does not wait for the remaining pages
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def iter_pdf_line_items(pdf, workers=1):
+    '''
+    Yield line items from a PDF (path, bytes or file-like), page by page:
+    rows of the tables pdfplumber finds, or numbered text lines ending in a
+    quantity and unit on pages without ruled tables. With `workers` > 1 and
+    a path, page ranges are read on a process pool.
+    '''
+    header = None
+    for n, parts in _iter_pdf_parts(pdf, workers):
+        for kind, content in parts:
+            if kind == "table":
+                items, header = _table_items(content, f"p. {n}", header)
+            else:
+                items = [{"Page/Sheet": f"p. {n}", **item} for item in content]
+            yield from items
+
+def iter_spreadsheet_line_items(xls, filename=""):
+    '''Yield line items from every sheet of a workbook, streamed row by row.'''
+    header, current = None, None
+    for sheet, n, cells in iter_spreadsheet_rows(xls, filename):
+        if sheet != current:
+            header, current = None, sheet
+        found, header = _table_items([cells], sheet, header)
+        for item in found:
+            item["Row"] = n
+            yield item
+
+def iter_line_items(doc, filename="", workers=1):
+    '''Line items of a PDF or (by `filename`) spreadsheet, given as bytes or a path.'''
+    if is_spreadsheet(filename):
+        return iter_spreadsheet_line_items(doc, filename)
+    return iter_pdf_line_items(doc, workers)
+
+def match_line_items(items, catalog=None, batch_rows=config.BOQ_MATCH_BATCH):
+    '''
+    Add "Best Product", "Recommended SKU" and "Match (%)" to each line item,
+    matching `batch_rows` descriptions per sparse matrix product. `items`
+    may be a generator: extraction and matching then interleave. Returns
+    the list of matched items.
+    '''
+    catalog = config.product_db if catalog is None else catalog
+    items = iter(items)
+    matched = []
+    while True:
+        chunk = list(islice(items, batch_rows))
+        if not chunk:
+            return matched
+        best_idx, best_score = batch_relevance([i["Description"] for i in chunk], catalog)
+        for item, idx, score in zip(chunk, best_idx, best_score):
+            hit = score > 0
+            item["Best Product"] = catalog[int(idx)] if hit else None
+            item["Recommended SKU"] = product_sku(int(idx)) if hit else None
+            item["Match (%)"] = round(float(score) * 100, 2)
+            matched.append(item)
+
+def extract_boq(doc, filename="", catalog=None, max_items=config.BOQ_MAX_ITEMS, workers=None):
+    '''
+    Extract and match the line items of a whole document (bytes or a path;
+    `filename` tells spreadsheets apart), at most `max_items` of them, PDF
+    pages being read on `workers` (PDF_WORKERS) processes. Results are
+    memoised per document and catalog version.
+    '''
+    catalog = config.product_db if catalog is None else catalog
+    doc_sha = document_sha(doc)
+    version = f"{catalog_version(catalog)}:{BOQ_VERSION}:{max_items}"
+    hit = analysis_cache_get(doc_sha, "boq", version)
+    if hit is not None:
+        count("analysis_cache", result="hit", kind="boq")
+        return hit
+    count("analysis_cache", result="miss", kind="boq")
+    with span("boq", sheet=is_spreadsheet(filename)) as timing:
+        workers = config.PDF_WORKERS if workers is None else workers
+        items = match_line_items(islice(iter_line_items(doc, filename, workers), max_items), catalog)
+        timing["items"] = len(items)
+    analysis_cache_put(doc_sha, "boq", version, items)
+    return items
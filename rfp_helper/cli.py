@@ -0,0 +1,279 @@
+'''
+Command line entry point: `python -m rfp_helper <command>`.
+
+    scrape     crawl the portals into the tender store
+    list       print the active tenders in the store
+    search     full-text search of the active tenders (titles, buyers, locations, documents)
+    analyze    extract, match and price one document (local file or URL)
+    boq        extract every line item of one document and match it to the catalog
+    batch      optionally scrape, then analyse and price the best tenders in parallel
+    prefetch   queue background analysis of the best-scored tenders
+    worker     run queued analysis jobs (for the UI and prefetches) on a process pool
+
+Data files (tender store, caches, document store) are relative to
+--data-dir, the current directory by default, as they are for the UI;
+document and --export paths given on the command line are relative to
+the current directory.
+'''
+import argparse
+import json
+import os
+import sys
+
+from . import config
+
+
+def _print_json(obj):
+    print(json.dumps(obj, indent=2, default=str))
+
+
+def _apply_crawl_options(args):
+    if args.source:
+        config.TENDER_SOURCES = args.source
+
+
+def cmd_scrape(args):
+    from .scrape import PortalsUnreachable, scrape_tenders
+    _apply_crawl_options(args)
+    try:
+        found = scrape_tenders(time_budget=args.time_budget or config.SCRAPE_TIME_BUDGET, incremental=not args.full)
+    except PortalsUnreachable as e:
+        print(f"Scrape failed: {e}", file=sys.stderr)
+        return 1
+    print(f"{len(found)} new tenders stored")
+    return 0
+
+
+def cmd_list(args):
+    from .store import load_analysis, query_tenders, tender_key
+    df = query_tenders(min_fit=args.min_fit, order_by=args.order_by, limit=args.limit)
+    rows = df.to_dict("records")
+    analysis = load_analysis([tender_key(r) for r in rows])
+    if args.json:
+        for r in rows:
+            r["Analysis"] = analysis.get(tender_key(r))
+        _print_json(rows)
+        return 0
+    for r in rows:
+        result = analysis.get(tender_key(r))
+        fit = f"{r['Product Fit']:5.1f}%" if r.get("Product Fit") is not None else "    - "
+        doc = f"  doc match {result['relevance']}%" if result and result["relevance"] is not None else ""
+        print(f"{r['Score']:7.1f}  {fit}  {str(r['Deadline'] or ''):<12} {r['Tender Title'][:90]}{doc}")
+    return 0
+
+
+def cmd_search(args):
+    from .search import apply_facets, search_tenders
+    df = search_tenders(" ".join(args.query), min_fit=args.min_fit)
+    df = apply_facets(df, {"Source": args.source, "Buyer": args.buyer, "Location": args.location}).head(args.limit)
+    if args.json:
+        _print_json(df.to_dict("records"))
+        return 0
+    for r in df.to_dict("records"):
+        print(f"{r['Relevance']:7.2f}  {str(r['Deadline'] or ''):<12} {r['Tender Title'][:80]:<80}  {r['Tender Key']}")
+    return 0
+
+
+def _local_document(source):
+    '''Path of a local or downloaded document, or None after printing why not.'''
+    from .documents import download_rfp
+    if source.startswith("http"):
+        path = download_rfp(source)
+        if not path:
+            print("Could not download the document.", file=sys.stderr)
+        return path
+    if not os.path.exists(source):
+        print(f"No such file: {source}", file=sys.stderr)
+        return None
+    return source
+
+
+def cmd_analyze(args):
+    from .pipeline import analyze_and_price
+    source = _local_document(args.document)
+    if not source:
+        return 1
+    text, match, rows, material, services = analyze_and_price(source, tests=args.tests, full=args.full, filename=source)
+    if args.export:
+        _export(rows, args.export)
+    if args.json:
+        _print_json({"match": {k: v for k, v in match.items() if k != "all_scores"}, "price_rows": _records(rows),
+                     "total_material": material, "total_services": services, "preview": text[:500]})
+        return 0
+    if match.get("skipped_pages"):
+        print(f"Warning: {len(match['skipped_pages'])} pages could not be read: "
+              f"{', '.join(str(n + 1) for n in match['skipped_pages'])}", file=sys.stderr)
+    print(f"Best match: {match['most_relevant']} ({match['relevance_percent']}%)")
+    for n, (product, pct) in enumerate(match["top_3"], 1):
+        print(f"  {n}. {product} ({pct}%)")
+    print(f"Total material (est): INR {material:,}")
+    print(f"Total services/tests (est): INR {services:,}")
+    return 0
+
+
+def _records(df):
+    '''DataFrame rows as dicts for JSON, missing values as None.'''
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def _export(df, path):
+    from .pricing import write_prices_csv, write_prices_xlsx
+    if path.lower().endswith(".xlsx"):
+        write_prices_xlsx(df, path)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            write_prices_csv(df, f)
+    print(f"Written to {path}", file=sys.stderr)
+
+
+def cmd_boq(args):
+    from .boq import extract_boq
+    from .pricing import format_inr, price_line_items
+    source = _local_document(args.document)
+    if not source:
+        return 1
+    items = extract_boq(source, filename=source, workers=args.workers)
+    df, material, services = price_line_items(items, args.tests or [], min_match=args.min_match or 0)
+    if args.min_match:
+        df = df[df["Match (%)"] >= args.min_match]
+    if args.export:
+        _export(df, args.export)
+    if args.json:
+        _print_json({"line_items": _records(df), "total_material": material, "total_services": services})
+        return 0
+    for i in _records(df.head(args.limit) if args.limit else df):
+        qty = f"{i['Quantity']:g} {i['Unit']}" if i["Quantity"] is not None else ""
+        print(f"{i['Page/Sheet']:<10} {i['Item']:<6} {i['Description'][:60]:<60} {qty:<14} "
+              f"{i['Recommended SKU'] or '-':<10} {i['Match (%)']:6.2f}% {format_inr(i['Amount (INR)']):>14}")
+    print(f"{len(df)} line items, material (est) {format_inr(material)}, tests {format_inr(services)}")
+    return 0
+
+
+def cmd_batch(args):
+    from .pipeline import run_pipeline
+    _apply_crawl_options(args)
+    summary = run_pipeline(scrape=args.scrape or args.full_scrape, incremental=not args.full_scrape,
+                           time_budget=args.time_budget,
+                           top=args.top, min_fit=args.min_fit, order_by=args.order_by,
+                           workers=args.workers, tests=args.tests, full=args.full)
+    if args.json:
+        _print_json(summary)
+        return 0
+    if summary.get("scrape_error"):
+        print(f"Scrape failed: {summary['scrape_error']}", file=sys.stderr)
+    elif summary["scraped"] is not None:
+        print(f"{summary['scraped']} new tenders stored")
+    for r in summary["results"]:
+        detail = f"{r['relevance']}% {r['best_product'][:50]}" if r["status"] == "ok" else (r["error"] or "")
+        if r.get("skipped_pages"):
+            detail += f" ({len(r['skipped_pages'])} pages unreadable)"
+        print(f"{r['status']:<16} {r['title'][:60]:<60} {detail}")
+    ok = sum(r["status"] == "ok" for r in summary["results"])
+    print(f"{ok}/{len(summary['results'])} tenders analysed")
+    return 0
+
+
+def cmd_prefetch(args):
+    from .jobs import prefetch_top_tenders, queue_summary, run_worker
+    keys = prefetch_top_tenders(top=args.top, full=args.full, start_worker=False)
+    print(f"{len(keys)} tenders queued")
+    if args.run:
+        print(f"{run_worker(workers=args.workers, idle_exit=0)} jobs finished")
+    print(", ".join(f"{status}: {n}" for status, n in sorted(queue_summary().items())))
+    return 0
+
+
+def cmd_worker(args):
+    from .jobs import run_worker
+    try:
+        finished = run_worker(workers=args.workers, idle_exit=args.idle_exit)
+    except KeyboardInterrupt:
+        return 0
+    print(f"{finished} jobs finished")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m rfp_helper", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=".", help="directory holding the store and caches")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    crawl = argparse.ArgumentParser(add_help=False)
+    crawl.add_argument("--source", action="append", help="listing URL to crawl instead of TENDER_SOURCES (repeatable)")
+    crawl.add_argument("--time-budget", type=float, help="seconds for the whole crawl")
+
+    p = sub.add_parser("scrape", parents=[crawl], help="crawl the portals into the tender store")
+    p.add_argument("--full", action="store_true", help="re-read listings instead of stopping at known tenders")
+    p.set_defaults(func=cmd_scrape)
+
+    ranking = argparse.ArgumentParser(add_help=False)
+    ranking.add_argument("--min-fit", type=float, help="minimum product fit (%%)")
+    ranking.add_argument("--order-by", choices=("score", "fit"), default="score")
+    ranking.add_argument("--json", action="store_true", help="print JSON instead of text")
+
+    p = sub.add_parser("list", parents=[ranking], help="print the active tenders in the store")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("search", help="full-text search of the active tenders")
+    p.add_argument("query", nargs="+", help="words to look for")
+    p.add_argument("--min-fit", type=float, help="minimum product fit (%%)")
+    p.add_argument("--source", action="append", help="only tenders from this source (repeatable)")
+    p.add_argument("--buyer", action="append", help="only tenders from this buyer (repeatable)")
+    p.add_argument("--location", action="append", help="only tenders at this location (repeatable)")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--json", action="store_true", help="print JSON instead of text")
+    p.set_defaults(func=cmd_search)
+
+    pricing = argparse.ArgumentParser(add_help=False)
+    pricing.add_argument("--tests", nargs="*", help="tests/acceptance activities to price (default: as in the UI)")
+    pricing.add_argument("--full", action="store_true", help="read whole documents instead of a preview")
+
+    p = sub.add_parser("analyze", parents=[pricing], help="extract, match and price one document")
+    p.add_argument("document", help="local PDF/XLS/XLSX path or http(s) URL")
+    p.add_argument("--json", action="store_true", help="print JSON instead of text")
+    p.add_argument("--export", help="also write the offer table to this .csv or .xlsx file")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("boq", help="extract every line item of one document and match it to the catalog")
+    p.add_argument("document", help="local PDF/XLS/XLSX path or http(s) URL")
+    p.add_argument("--min-match", type=float, help="only items matching a product at least this well (%%)")
+    p.add_argument("--tests", nargs="*", help="tests/acceptance activities priced once for the offer")
+    p.add_argument("--export", help="also write the priced items to this .csv or .xlsx file")
+    p.add_argument("--limit", type=int, help="print at most this many items")
+    p.add_argument("--workers", type=int, help=f"processes reading PDF pages (default {config.PDF_WORKERS})")
+    p.add_argument("--json", action="store_true", help="print JSON instead of text")
+    p.set_defaults(func=cmd_boq)
+
+    p = sub.add_parser("batch", parents=[crawl, ranking, pricing], help="analyse and price the best tenders in parallel")
+    p.add_argument("--scrape", action="store_true", help="run an incremental scrape first")
+    p.add_argument("--full-scrape", action="store_true", help="run a full scrape first")
+    p.add_argument("--top", type=int, help=f"tenders to analyse (default {config.BATCH_TOP_TENDERS})")
+    p.add_argument("--workers", type=int, help=f"parallel processes (default {config.BATCH_WORKERS})")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("prefetch", help="queue background analysis of the best-scored tenders")
+    p.add_argument("--top", type=int, help=f"tenders to queue (default {config.PREFETCH_TOP_TENDERS})")
+    p.add_argument("--full", action="store_true", help="read whole documents instead of a preview")
+    p.add_argument("--run", action="store_true", help="process the queue now instead of leaving it to a worker")
+    p.add_argument("--workers", type=int, help=f"parallel processes with --run (default {config.JOB_WORKERS})")
+    p.set_defaults(func=cmd_prefetch)
+
+    p = sub.add_parser("worker", help="run queued analysis jobs on a process pool")
+    p.add_argument("--workers", type=int, help=f"parallel processes (default {config.JOB_WORKERS})")
+    p.add_argument("--idle-exit", type=float, help="stop after the queue is empty this many seconds (default: never)")
+    p.set_defaults(func=cmd_worker)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # user paths are resolved before the working directory becomes the data directory
+    for name in ("document", "export"):
+        value = getattr(args, name, None)
+        if value and not value.startswith("http"):
+            setattr(args, name, os.path.abspath(value))
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.chdir(args.data_dir)
+    return args.func(args)
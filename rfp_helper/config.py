@@ -0,0 +1,126 @@
+'''
+Settings shared by the pipeline modules. Modules read them as
+`config.NAME` when they run, so a script or the CLI can override a value
+by assigning to it before calling a stage. Values that serve as keyword
+argument defaults are fixed at import; pass the argument instead.
+'''
+import os
+
+# ----------------------------
+# Product DB (sample)
+# ----------------------------
+product_db = [
+    'Interior Emulsion Paint – White, 20L, ISI certified (IS 15489), Low VOC (<50 g/L), Min. coverage 160 sq.ft/L, scrub resistance >500 cycles',
+    'Interior Emulsion Paint – Light Green, 20L, ISI certified (IS 15489), Low VOC (<50 g/L), Min. coverage 150 sq.ft/L',
+    'Waterproof Primer – 5L, Oil-based Alkyd, Flashpoint >40°C, exterior application, minimum 5-year warranty against peeling',
+    'De-Rusting Primer, Rust converter, Chromate-free, Water-based, minimum 3-year warranty, for steel substrates'
+]
+
+# ----------------------------
+# Tender sources (add more as needed)
+# ----------------------------
+TENDER_SOURCES = [
+    "https://etenders.gov.in/eprocure/app?component=%24DirectLink&page=FrontEndLatestActiveTenders&service=direct&session=T",
+    "https://www.eprocure.gov.in/cppp/latestactivetendersnew/cpppdata",
+    "https://etenders.gov.in/eprocure/app?page=FrontEndTendersByOrganisation&service=page",
+    "https://etender.up.nic.in/nicgep/app?component=%24DirectLink&page=FrontEndLatestActiveTenders&service=direct",
+]
+
+CACHE_FILE = "rfp_cache.json"   # legacy JSON cache, imported into TENDER_DB once
+TENDER_DB = "rfp_tenders.db"
+PRODUCT_INDEX_FILE = "product_index.pkl"   # persisted TF-IDF index over the product catalog
+SCORE_WEIGHTS_FILE = "score_weights.json"   # optional overrides for SCORE_WEIGHTS
+
+# Content-addressed document store
+DOC_STORE_DIR = "doc_store"
+MAX_DOC_BYTES = 100 * 1024 * 1024   # larger documents are refused
+DOWNLOAD_CHUNK = 64 * 1024
+PARTIAL_MAX_AGE = 24 * 3600   # seconds before an abandoned partial download is deleted
+
+# PDF text extraction
+PDF_PREVIEW_CHARS = 5000      # preview mode stops reading pages past this
+PDF_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+PDF_PAGES_PER_TASK = 8        # pages per process-pool task in full-document mode
+PDF_PAGE_TIMEOUT = 20         # seconds before a single page is given up on
+
+# Spreadsheet (BOQ) ingestion
+SHEET_PREVIEW_ROWS = 500      # preview stops after this many non-empty rows...
+SHEET_PREVIEW_CHARS = 5000    # ...or this many characters, whichever comes first
+SHEET_CHUNK_ROWS = 1000       # rows per chunk in full mode
+
+# Bill of quantities (line items) extraction and matching
+BOQ_MAX_ITEMS = 20000         # line items read per document
+BOQ_MATCH_BATCH = 2000        # line items matched per sparse matrix product
+BOQ_MIN_DESCRIPTION = 8       # shorter cells are not taken for an item description
+
+# Pricing
+PRICE_TABLE_FILE = "price_table.csv"   # sku,product,unit_price; the demo prices are used without it
+EXPORT_CHUNK_ROWS = 5000      # rows per chunk when streaming price tables to CSV/XLSX
+
+# Full-text tender search (BM25 over the inverted index in the tender store)
+SEARCH_FIELD_WEIGHTS = {"title": 3.0, "buyer": 2.0, "location": 2.0, "text": 1.0}
+SEARCH_BM25_K1 = 1.2          # term frequency saturation
+SEARCH_BM25_B = 0.75          # document length normalisation
+SEARCH_TEXT_CHARS = 200_000   # extracted document text indexed per tender
+SEARCH_MAX_RESULTS = 1000     # best-ranked matches returned per query
+FACET_VALUES_SHOWN = 30       # most frequent values offered per facet
+
+# Persistent memo of extracted text and match results, keyed by document hash
+ANALYSIS_CACHE_MAX_BYTES = 200 * 1024 * 1024   # least recently used entries are evicted past this
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0 Safari/537.36"
+}
+
+# Concurrent fetch settings
+FETCH_WORKERS = 8             # portals fetched in parallel
+PER_HOST_CONCURRENCY = 2      # max in-flight requests per host
+SCRAPE_TIME_BUDGET = 60       # seconds for a whole refresh; slower portals are dropped
+
+# Incremental scraping
+WATERMARK_SIZE = 300          # most recent tender keys remembered per portal
+KNOWN_STOP_AFTER = 3          # consecutive already-known rows that end a listing
+
+# Pagination crawl limits, per portal
+MAX_PAGES_PER_PORTAL = 5
+MAX_ROWS_PER_PORTAL = 200
+PORTAL_TIME_BUDGET = 30       # seconds; no new pages are requested after this
+PAGES_IN_FLIGHT = 2           # pages of one portal fetched concurrently
+DATE_BATCH_ROWS = 50          # listing rows whose deadlines are parsed together
+
+# Background refresh (stale-while-revalidate)
+REFRESH_TTL = 30 * 60         # seconds before served tenders are considered stale
+MIN_REFRESH_INTERVAL = 60     # forced refreshes closer together than this are ignored
+
+# On-disk HTTP cache for safe_get
+HTTP_CACHE_DIR = "http_cache"
+HTTP_CACHE_TTL = 15 * 60      # seconds a response without ETag/Last-Modified stays fresh
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024   # least recently used responses are evicted past this
+
+# Retry policy and per-portal circuit breaker
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}   # everything else is permanent
+RETRY_MAX_DELAY = 30          # cap for backoff and Retry-After, seconds
+CIRCUIT_FILE = os.path.join(os.path.dirname(CACHE_FILE), "rfp_circuit.json")
+CIRCUIT_FAILURE_THRESHOLD = 3 # consecutive failed fetches before a host is skipped
+CIRCUIT_COOLDOWN = 30 * 60    # seconds a tripped host is skipped
+CIRCUIT_PROBE_TIMEOUT = 60    # seconds after which an unanswered half-open probe may be retried
+
+# Instrumentation
+METRICS_LOG_FILE = "rfp_metrics.jsonl"        # structured event log: spans, runs, errors
+METRICS_LOG_MAX_BYTES = 5 * 1024 * 1024       # rotated to .1 past this
+METRICS_PROM_FILE = "rfp_metrics.prom"        # Prometheus text export, rewritten after each scrape
+METRICS_SAMPLES = 1000        # latest durations kept per stage/portal for percentiles
+METRICS_RUNS_SHOWN = 20       # scrape runs listed on the Diagnostics page
+
+# Headless batch pipeline (rfp_helper.pipeline and the CLI)
+BATCH_WORKERS = PDF_WORKERS   # tenders analysed in parallel, one process each
+BATCH_TOP_TENDERS = 20        # best-scored tenders taken from the store per batch run
+
+# Background analysis jobs (rfp_helper.jobs)
+JOB_WORKERS = 2               # worker processes running download -> extract -> match
+JOB_POLL_INTERVAL = 1.0       # seconds between queue checks while jobs are running
+JOB_IDLE_EXIT = 30            # seconds the in-process worker waits on an empty queue before stopping
+JOB_TIMEOUT = 30 * 60         # running jobs older than this are assumed lost and re-queued
+JOB_MAX_ATTEMPTS = 2          # ...at most this many times, then marked failed
+JOB_INTERACTIVE_PRIORITY = 1e6   # a tender opened in the UI jumps ahead of prefetches (priority = score)
+PREFETCH_TOP_TENDERS = 10     # best-scored tenders analysed after each refresh
+PREFETCH_AFTER_REFRESH = True
@@ -0,0 +1,86 @@
+'''Deadline parsing: single values, and whole columns with per-portal format inference.'''
+import re
+from datetime import datetime, timedelta
+
+DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%d-%b-%Y", "%d-%B-%Y", "%d/%m/%y", "%Y/%m/%d")
+DATE_RE = re.compile(r"(\d{2}[\-/.]\d{2}[\-/.]\d{4})")
+
+def parse_date_flex(date_str):
+    '''Try multiple common date formats; return datetime or None.'''
+    if not date_str or str(date_str).strip() == "":
+        return None
+    date_str = str(date_str).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except Exception:
+            continue
+    # Try to extract with regex (PRESERVED USER'S EXACT REGEX)
+    m = re.search(r"(\d{2}[\-/.]\d{2}[\-/.]\d{4})", date_str)
+    if m:
+        for fmt in ("%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y"):
+            try:
+                return datetime.strptime(m.group(1), fmt)
+            except Exception:
+                continue
+    return None
+
+_portal_date_formats = {}
+
+def _date_format_for(portal):
+    from .store import get_store_meta  # the store parses dates itself
+    if portal not in _portal_date_formats:
+        _portal_date_formats[portal] = get_store_meta(f"date_format:{portal}")
+    return _portal_date_formats[portal]
+
+def _remember_date_format(portal, fmt):
+    from .store import set_store_meta
+    if fmt and _portal_date_formats.get(portal) != fmt:
+        _portal_date_formats[portal] = fmt
+        set_store_meta(f"date_format:{portal}", fmt)
+
+def parse_deadlines(values, portal=None):
+    '''
+    Vectorised parse_date_flex over a whole column; returns a datetime64 Series.
+    The format that matched most values on `portal` last time is tried first,
+    so a batch from a known portal is usually parsed in a single pass; other
+    DATE_FORMATS only see the leftovers, and the dd-mm-yyyy regex fallback
+    only what no format matched.
+    '''
+    import pandas as pd
+    s = pd.Series(values, dtype="string").str.strip()
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    remaining = s.notna() & (s != "")
+    remembered = _date_format_for(portal) if portal else None
+    formats = ([remembered] if remembered else []) + [f for f in DATE_FORMATS if f != remembered]
+    best_fmt, best_hits = None, 0
+    for fmt in formats:
+        if not remaining.any():
+            break
+        parsed = pd.to_datetime(s[remaining], format=fmt, errors="coerce")
+        hits = parsed.notna()
+        if hits.any():
+            out[parsed.index[hits]] = parsed[hits]
+            remaining &= out.isna()
+            if hits.sum() > best_hits:
+                best_fmt, best_hits = fmt, int(hits.sum())
+    if remaining.any():
+        found = s[remaining].str.extract(DATE_RE, expand=False).str.replace(r"[/.]", "-", regex=True)
+        parsed = pd.to_datetime(found, format="%d-%m-%Y", errors="coerce")
+        out[parsed.index[parsed.notna()]] = parsed[parsed.notna()]
+    if portal and best_fmt:
+        _remember_date_format(portal, best_fmt)
+    return out
+
+def due_within(dates, days=90):
+    '''Vectorised is_due_within_3_months over a parsed datetime Series.'''
+    import pandas as pd
+    now = pd.Timestamp.now()
+    return (dates >= now) & (dates <= now + pd.Timedelta(days=days))
+
+def is_due_within_3_months(deadline_str):
+    d = parse_date_flex(deadline_str)
+    if not d:
+        return False
+    now = datetime.now()
+    return now <= d <= now + timedelta(days=90)
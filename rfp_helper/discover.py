@@ -0,0 +1,96 @@
+'''
+Sales Agent discover wrapper (Functional Fix): serve tenders from the
+store and refresh it in the background (stale-while-revalidate), then
+queue analysis of the best new tenders.
+'''
+import threading
+import time
+
+from . import config
+from .jobs import prefetch_top_tenders
+from .matching import refresh_product_fit
+from .metrics import log_error
+from .scoring import merge_near_duplicates
+from .search import search_tenders
+from .store import get_store_meta, query_tenders
+
+# Refresh state shared by every session and rerun of this server process
+_refresh = {"lock": threading.Lock(), "thread": None, "error": None, "failed_at": None}
+
+def data_age():
+    '''Seconds since the last completed scrape, or None if there never was one.'''
+    last = get_store_meta("last_refresh")
+    return time.time() - float(last) if last else None
+
+def refresh_in_progress():
+    thread = _refresh["thread"]
+    return thread is not None and thread.is_alive()
+
+def last_refresh_error():
+    '''Message of the last failed background refresh, or None.'''
+    return _refresh["error"]
+
+def request_refresh(full=False):
+    '''
+    Start a background scrape into the store. Returns False when a scrape is
+    already running: concurrent requests from other sessions coalesce into it.
+    '''
+    ref = _refresh
+    with ref["lock"]:
+        if ref["thread"] is not None and ref["thread"].is_alive():
+            return False
+
+        def run():
+            try:
+                # imported here: serving from the store needs no HTML parser
+                from .scrape import scrape_tenders
+                scrape_tenders(incremental=not full)
+                ref["error"] = ref["failed_at"] = None
+                if config.PREFETCH_AFTER_REFRESH:
+                    prefetch_top_tenders()
+            except Exception as e:
+                ref["error"] = str(e)
+                ref["failed_at"] = time.time()
+                log_error("refresh", e)
+
+        ref["thread"] = threading.Thread(target=run, name="tender-refresh", daemon=True)
+        ref["thread"].start()
+        return True
+
+def format_age(seconds):
+    if seconds is None:
+        return "never"
+    if seconds < 90:
+        return "just now"
+    if seconds < 90 * 60:
+        return f"{int(seconds // 60)} min ago"
+    if seconds < 48 * 3600:
+        return f"{int(seconds // 3600)} h ago"
+    return f"{int(seconds // 86400)} days ago"
+
+def sales_agent_discover(force_refresh=False, min_fit=None, order_by="score", query=None):
+    '''
+    Serve the last good tender set from the store straight away, and kick
+    off a background refresh when it is older than REFRESH_TTL (or when
+    forced). A failed refresh is retried no sooner than MIN_REFRESH_INTERVAL
+    later. With a search `query` only matching tenders are served, most
+    relevant first. Returns (tenders, df, age_seconds).
+    '''
+    age = data_age()
+    failed_at = _refresh["failed_at"]
+    retry_ok = failed_at is None or time.time() - failed_at > config.MIN_REFRESH_INTERVAL
+    if (retry_ok and (age is None or age > config.REFRESH_TTL)) or \
+            (force_refresh and (age is None or age > config.MIN_REFRESH_INTERVAL)):
+        request_refresh(full=force_refresh)
+    # No-op unless the catalog changed or tenders arrived without a fit
+    refresh_product_fit()
+    # Only active tenders are read, already ranked
+    if query and query.strip():
+        df = search_tenders(query, min_fit=min_fit)
+    else:
+        df = query_tenders(min_fit=min_fit, order_by=order_by)
+    # The same tender cross-listed on several portals is shown (and analysed) once
+    df = merge_near_duplicates(df)
+    if df.empty:
+        return [], df, age
+    return df.to_dict("records"), df, age
@@ -0,0 +1,454 @@
+'''
+Tender documents: the content-addressed download store, and text
+extraction from PDFs and spreadsheets. pdfplumber, openpyxl and pandas
+are imported on first use.
+'''
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+import tempfile
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from . import config
+from .fetch import backoff_delay, circuit_state, get_session, host_of, host_slot, record_fetch_result
+from .metrics import count, log_error, span
+from .store import store_connect
+from .util import atomic_write, process_pool
+
+# ----------------------------
+# Document store
+# ----------------------------
+def lookup_document(url):
+    '''Local path of a previously downloaded URL, if its file is still in the store.'''
+    conn = store_connect()
+    try:
+        row = conn.execute("SELECT path FROM documents WHERE url = ?", (url,)).fetchone()
+    finally:
+        conn.close()
+    if row and os.path.exists(row["path"]):
+        return row["path"]
+    return None
+
+def _record_document(url, sha, path, size, content_type):
+    conn = store_connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (url, sha256, path, size, content_type, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, sha, path, size, content_type, datetime.now().isoformat(timespec="seconds")),
+            )
+    finally:
+        conn.close()
+
+def _doc_extension(url, content_type):
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    if ext and len(ext) <= 6:
+        return ext
+    return ".pdf" if "pdf" in (content_type or "") else ".bin"
+
+def _discard_partial(part):
+    for path in (part, part + ".json"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _partial_path(url):
+    '''
+    Partial file of this process and thread for `url`: concurrent downloads
+    of one URL (two job workers, batch tenders sharing a document) each
+    write their own, and only the caller's own retries resume it.
+    '''
+    partial_dir = os.path.join(config.DOC_STORE_DIR, "partial")
+    os.makedirs(partial_dir, exist_ok=True)
+    name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(partial_dir, f"{name}.{os.getpid()}.{threading.get_ident()}.part")
+
+def _prune_partials():
+    '''Delete partial downloads left behind by callers that died, after PARTIAL_MAX_AGE.'''
+    partial_dir = os.path.join(config.DOC_STORE_DIR, "partial")
+    cutoff = time.time() - config.PARTIAL_MAX_AGE
+    try:
+        entries = list(os.scandir(partial_dir))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-\d+/(\d+)")
+
+def _expected_size(resp):
+    '''(first byte, total size) a 200/206 response declares, None where it does not (or is encoded).'''
+    if resp.headers.get("Content-Encoding", "identity") != "identity":
+        return 0, None   # Content-Length counts the encoded bytes
+    if resp.status_code == 206:
+        m = _CONTENT_RANGE_RE.match(resp.headers.get("Content-Range", ""))
+        return (int(m.group(1)), int(m.group(2))) if m else (None, None)
+    length = resp.headers.get("Content-Length")
+    return 0, int(length) if length and length.isdigit() else None
+
+def _stream_download(url, max_bytes):
+    '''
+    One download attempt into the caller's partial file, resuming what an
+    earlier attempt of the same caller left with Range/If-Range. Returns the
+    content-addressed path, or None when the response is unusable or the
+    document exceeds max_bytes. Network errors, and bodies shorter than
+    their Content-Length/Content-Range, propagate (as OSError), leaving the
+    partial file for the next attempt.
+    '''
+    part = _partial_path(url)
+    part_meta_path = part + ".json"
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    try:
+        with open(part_meta_path, "r") as f:
+            part_meta = json.load(f)
+    except Exception:
+        part_meta, have = {}, 0
+    headers = {}
+    if have:
+        headers["Range"] = f"bytes={have}-"
+        validator = part_meta.get("etag") or part_meta.get("last_modified")
+        if validator:
+            headers["If-Range"] = validator
+    session = get_session(url)
+    with host_slot(url):
+        with session.get(url, headers=headers, stream=True, timeout=12) as resp:
+            if resp.status_code == 416 and have:
+                # nothing left to fetch: the partial file is complete, if it has the size first announced
+                if part_meta.get("size") not in (None, have):
+                    _discard_partial(part)
+                    raise OSError(f"partial download of {have} bytes, expected {part_meta['size']}")
+            elif resp.status_code in (200, 206):
+                start, total = _expected_size(resp)
+                if resp.status_code == 206 and start != have:
+                    _discard_partial(part)
+                    raise OSError(f"range response starts at byte {start}, expected {have}")
+                if resp.status_code == 200:
+                    have = 0
+                    part_meta = {
+                        "etag": resp.headers.get("ETag"),
+                        "last_modified": resp.headers.get("Last-Modified"),
+                        "content_type": resp.headers.get("Content-Type", ""),
+                        "size": total,
+                    }
+                    atomic_write(part_meta_path, json.dumps(part_meta), mode="w")
+                elif total is not None and part_meta.get("size") is None:
+                    part_meta["size"] = total
+                    atomic_write(part_meta_path, json.dumps(part_meta), mode="w")
+                declared = int(resp.headers.get("Content-Length") or 0)
+                if have + declared > max_bytes:
+                    _discard_partial(part)
+                    return None
+                written = have
+                with open(part, "ab" if have else "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=config.DOWNLOAD_CHUNK):
+                        written += len(chunk)
+                        if written > max_bytes:
+                            break
+                        f.write(chunk)
+                if written > max_bytes:
+                    _discard_partial(part)
+                    return None
+                if total is not None and written != total:
+                    raise OSError(f"download ended at byte {written} of {total}")
+            else:
+                return None
+    hasher = hashlib.sha256()
+    with open(part, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    sha = hasher.hexdigest()
+    content_type = part_meta.get("content_type", "")
+    final_dir = os.path.join(config.DOC_STORE_DIR, sha[:2])
+    os.makedirs(final_dir, exist_ok=True)
+    final = os.path.join(final_dir, sha + _doc_extension(url, content_type))
+    size = os.path.getsize(part)
+    if os.path.exists(final):
+        _discard_partial(part)  # same content already stored under another URL
+    else:
+        os.replace(part, final)
+        _discard_partial(part)
+    _record_document(url, sha, final, size, content_type)
+    return final
+
+def download_rfp(url, tries=3, backoff=1, max_bytes=config.MAX_DOC_BYTES, refresh=False):
+    '''
+    Download a remote document into the content-addressed store (keyed by
+    SHA-256 of its bytes) and return the local path. Supports http(s).
+    A URL fetched before is reused without a request unless `refresh`.
+    The body is streamed in chunks and capped at `max_bytes`; an interrupted
+    transfer resumes where it stopped on the next of its `tries`.
+    '''
+    if not url or not url.startswith("http"):
+        return None
+    if not refresh:
+        known = lookup_document(url)
+        if known:
+            return known
+    _prune_partials()
+    host = host_of(url)
+    if circuit_state(url) == "open":
+        count("http_skipped", host=host)
+        return None
+    error = None
+    with span("download", host) as dl:
+        for attempt in range(tries):
+            try:
+                path = _stream_download(url, max_bytes)
+                record_fetch_result(url, True)
+                dl["ok"] = path is not None
+                if path:
+                    dl["bytes"] = os.path.getsize(path)
+                    count("doc_bytes", dl["bytes"], host=host)
+                return path
+            except (requests.RequestException, OSError) as e:
+                error = e
+                if attempt < tries - 1:
+                    count("http_retries", host=host)
+                    time.sleep(backoff_delay(attempt, backoff))
+        dl["ok"] = False
+        _discard_partial(_partial_path(url))   # no later attempt of this caller will resume it
+    record_fetch_result(url, False)
+    log_error("download", error, host=host, url=url, attempts=tries)
+    return None
+
+def document_url(tender):
+    '''Absolute URL of a tender's document: portals often list it relative to the listing page.'''
+    link = (tender.get("Doc Link") or "").strip()
+    source = tender.get("Source") or ""
+    if link and not link.startswith("http") and source.startswith("http"):
+        link = urljoin(source, link)
+    return link if link.startswith("http") else ""
+
+# ----------------------------
+# PDF / RFP extraction
+# ----------------------------
+def pdf_source(pdf):
+    '''pdfplumber accepts a path or a file-like object; wrap raw bytes.'''
+    return BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf
+
+def iter_pdf_pages_text(pdf):
+    '''Yield (page_number, text) one page at a time from a path, bytes or file-like object.'''
+    import pdfplumber
+    with pdfplumber.open(pdf_source(pdf)) as doc:
+        for n, page in enumerate(doc.pages):
+            try:
+                yield n, page.extract_text() or ""
+            finally:
+                page.close()
+
+def extract_pdf_text_with_offsets(pdf, max_chars=config.PDF_PREVIEW_CHARS):
+    '''
+    Return (text, page_offsets): up to `max_chars` of text, reading only the
+    pages needed, and {page_number: offset of that page's text}. Raises if
+    the PDF cannot be read.
+    '''
+    text, offsets, chars = [], {}, 0
+    for n, page_text in iter_pdf_pages_text(pdf):
+        if page_text:
+            offsets[n] = chars
+            text.append(page_text)
+            chars += len(page_text) + 1
+            if max_chars and chars >= max_chars:
+                break
+    joined = "\n".join(text)
+    if max_chars:
+        joined = joined[:max_chars]
+        offsets = {n: off for n, off in offsets.items() if off < max_chars}
+    return joined, offsets
+
+def extract_rfp_text_from_pdf_buffer(pdf_buffer, max_chars=config.PDF_PREVIEW_CHARS):
+    '''Accept bytes buffer, path or file-like; return up to `max_chars` of text, reading only the pages needed.'''
+    with span("pdf_preview") as pdf:
+        try:
+            text = extract_pdf_text_with_offsets(pdf_buffer, max_chars)[0]
+            pdf["chars"] = len(text)
+            return text
+        except Exception as e:
+            pdf["ok"] = False
+            log_error("pdf_preview", e)
+            return "Could not reliably extract PDF text (file might be scanned or protected)."
+
+def extract_rfp_text_from_pdf(pdf_path, max_chars=config.PDF_PREVIEW_CHARS):
+    try:
+        return extract_rfp_text_from_pdf_buffer(pdf_path, max_chars=max_chars)
+    except Exception:
+        return "Could not extract RFP text from PDF."
+
+def extract_pdf_text_parallel(pdf_path, workers=config.PDF_WORKERS, page_timeout=config.PDF_PAGE_TIMEOUT, max_chars=None):
+    '''
+    Full-document mode: extract pages on a process pool, PDF_PAGES_PER_TASK
+    pages per task, at most `workers` tasks in flight. Pages that fail or
+    exceed `page_timeout` are skipped. With `max_chars`, no further page
+    ranges are submitted once that much text is in hand.
+    Returns (text, skipped_page_numbers).
+    '''
+    text, _, skipped = extract_pdf_text_parallel_with_offsets(pdf_path, workers, page_timeout, max_chars)
+    return text, skipped
+
+def extract_pdf_text_parallel_with_offsets(pdf, workers=config.PDF_WORKERS, page_timeout=config.PDF_PAGE_TIMEOUT,
+                                           max_chars=None):
+    '''
+    extract_pdf_text_parallel for a path or bytes (spilled to a temporary
+    file for the workers), also returning the page offsets as
+    extract_pdf_text_with_offsets does: (text, page_offsets, skipped_page_numbers).
+    '''
+    spilled = None
+    if not isinstance(pdf, str):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(pdf if isinstance(pdf, (bytes, bytearray)) else pdf.read())
+        pdf = spilled = f.name
+    try:
+        with span("pdf_full") as timing:
+            text, offsets, skipped = _extract_pdf_text_parallel(pdf, workers, page_timeout, max_chars)
+            timing.update(chars=len(text), pages_skipped=len(skipped))
+    finally:
+        if spilled:
+            os.remove(spilled)
+    if skipped:
+        count("pdf_pages_skipped", len(skipped))
+    return text, offsets, skipped
+
+def _extract_pdf_text_parallel(pdf_path, workers, page_timeout, max_chars):
+    import pdfplumber
+    from . import pdf_worker
+    with pdfplumber.open(pdf_path) as doc:
+        n_pages = len(doc.pages)
+    ranges = deque((s, min(s + config.PDF_PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, config.PDF_PAGES_PER_TASK))
+    pages, skipped, chars = {}, [], 0
+    pending = {}
+    pool = process_pool(workers)
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < workers and not (max_chars and chars >= max_chars):
+                start, stop = ranges.popleft()
+                try:
+                    fut = pool.submit(pdf_worker.extract_page_range, pdf_path, start, stop, page_timeout)
+                except BrokenProcessPool as e:
+                    # a worker died (e.g. killed on a page); nothing more can run on this pool
+                    for first, last in [(start, stop), *ranges]:
+                        skipped.extend(range(first, last))
+                    ranges.clear()
+                    log_error("pdf_full", e, pages=f"{start}-{n_pages}")
+                    break
+                pending[fut] = (start, stop)
+            if not pending:
+                break
+            # the per-page alarm should fire first; this only guards against a wedged worker
+            done, _ = wait(pending, timeout=page_timeout * config.PDF_PAGES_PER_TASK + 10, return_when=FIRST_COMPLETED)
+            if not done:
+                for start, stop in pending.values():
+                    skipped.extend(range(start, stop))
+                for start, stop in ranges:
+                    skipped.extend(range(start, stop))
+                break
+            for fut in done:
+                start, stop = pending.pop(fut)
+                try:
+                    for n, page_text in fut.result():
+                        if page_text is None:
+                            skipped.append(n)
+                        else:
+                            pages[n] = page_text
+                            chars += len(page_text)
+                except Exception as e:
+                    skipped.extend(range(start, stop))
+                    log_error("pdf_full", e, pages=f"{start}-{stop}")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    text, offsets, at = [], {}, 0
+    for n in sorted(pages):
+        if pages[n]:
+            offsets[n] = at
+            text.append(pages[n])
+            at += len(pages[n]) + 1
+    joined = "\n".join(text)
+    if max_chars:
+        joined = joined[:max_chars]
+        offsets = {n: off for n, off in offsets.items() if off < max_chars}
+    return joined, offsets, sorted(skipped)
+
+# ----------------------------
+# Spreadsheet (XLS/XLSX) ingestion
+# ----------------------------
+def _cell_str(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def iter_spreadsheet_rows(xls, filename=""):
+    '''
+    Yield (sheet_name, row_number, [cell strings]) for every non-empty row
+    of every sheet. .xlsx is streamed with openpyxl's read-only mode, so
+    rows are never all in memory; legacy .xls (which openpyxl cannot read)
+    goes through pandas one sheet at a time.
+    '''
+    src = BytesIO(xls) if isinstance(xls, (bytes, bytearray)) else xls
+    if filename.lower().endswith(".xls"):
+        import pandas as pd
+        for sheet, df in pd.read_excel(src, sheet_name=None, header=None, dtype=object).items():
+            for n, row in enumerate(df.itertuples(index=False), 1):
+                cells = [_cell_str(v) if not pd.isna(v) else "" for v in row]
+                if any(cells):
+                    yield sheet, n, cells
+        return
+    from openpyxl import load_workbook
+    wb = load_workbook(src, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            for n, row in enumerate(ws.iter_rows(values_only=True), 1):
+                cells = [_cell_str(v) for v in row]
+                if any(cells):
+                    while not cells[-1]:
+                        cells.pop()
+                    yield ws.title, n, cells
+    finally:
+        wb.close()
+
+def extract_spreadsheet_text_with_offsets(xls, filename="", max_rows=config.SHEET_PREVIEW_ROWS, max_chars=config.SHEET_PREVIEW_CHARS):
+    '''
+    Preview text of a workbook across all sheets, one " | "-joined line per
+    row, stopping at `max_rows` rows or `max_chars` characters. Returns
+    (text, {sheet_name: offset of its first line}).
+    '''
+    lines, offsets, chars, current = [], {}, 0, None
+    for rows, (sheet, _, cells) in enumerate(iter_spreadsheet_rows(xls, filename)):
+        if (max_rows and rows >= max_rows) or (max_chars and chars >= max_chars):
+            break
+        if sheet != current:
+            current = sheet
+            offsets[sheet] = chars
+            lines.append(f"[{sheet}]")
+            chars += len(sheet) + 3
+        line = " | ".join(cells)
+        lines.append(line)
+        chars += len(line) + 1
+    text = "\n".join(lines)
+    return (text[:max_chars] if max_chars else text), offsets
+
+def iter_spreadsheet_chunks(xls, filename="", chunk_rows=config.SHEET_CHUNK_ROWS):
+    '''Full mode: yield lists of up to `chunk_rows` (sheet_name, row_number, cells) rows for batch line-item matching.'''
+    chunk = []
+    for row in iter_spreadsheet_rows(xls, filename):
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,324 @@
+'''
+HTTP layer: pooled per-host sessions, an on-disk conditional-GET cache
+(size-capped, least recently used first out), retries with backoff and a
+per-host circuit breaker.
+'''
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from . import config
+from .metrics import count, log_error
+from .util import atomic_write
+
+# ----------------------------
+# Connection pooling
+# ----------------------------
+_sessions = {}
+_host_slots = {}
+_pool_lock = threading.Lock()
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+def get_session(url):
+    '''Keep-alive session shared by all requests to the same host.'''
+    host = host_of(url)
+    with _pool_lock:
+        sess = _sessions.get(host)
+        if sess is None:
+            sess = requests.Session()
+            sess.headers.update(config.HEADERS)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.PER_HOST_CONCURRENCY)
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            _sessions[host] = sess
+            _host_slots[host] = threading.BoundedSemaphore(config.PER_HOST_CONCURRENCY)
+        return sess
+
+def host_slot(url):
+    '''Semaphore limiting concurrent requests to the url's host.'''
+    get_session(url)
+    return _host_slots[host_of(url)]
+
+# ----------------------------
+# HTTP response cache (conditional GET)
+# ----------------------------
+_cache_stats = {"hits": 0, "misses": 0, "revalidated": 0}
+_cache_stats_lock = threading.Lock()
+_cache_bytes = {"total": None, "lock": threading.Lock()}   # running size of HTTP_CACHE_DIR, None until scanned
+
+def _count_cache(stat):
+    with _cache_stats_lock:
+        _cache_stats[stat] += 1
+    count("http_cache", result=stat)
+
+def http_cache_stats():
+    '''Counts of fresh hits, full downloads (misses) and 304 revalidations.'''
+    with _cache_stats_lock:
+        return dict(_cache_stats)
+
+def _cache_paths(url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(config.HTTP_CACHE_DIR, key + ".json"), os.path.join(config.HTTP_CACHE_DIR, key + ".body")
+
+def cache_load(url):
+    '''Return (meta, body) for a cached url, or (None, None).'''
+    meta_path, body_path = _cache_paths(url)
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        with open(body_path, "rb") as f:
+            return meta, f.read()
+    except Exception:
+        return None, None
+
+def _mark_used(url):
+    '''Bump the body file's mtime: eviction goes by last use, and meta's stored_at drives the TTL.'''
+    try:
+        os.utime(_cache_paths(url)[1])
+    except OSError:
+        pass
+
+def _prune_http_cache(max_bytes):
+    '''
+    Delete the least recently used entries (oldest body mtime first) until
+    HTTP_CACHE_DIR holds at most `max_bytes`. Returns the bytes kept.
+    '''
+    entries = {}
+    try:
+        for entry in os.scandir(config.HTTP_CACHE_DIR):
+            key, ext = os.path.splitext(entry.name)
+            if ext not in (".json", ".body"):
+                continue
+            stat = entry.stat()
+            item = entries.setdefault(key, [0, 0.0])
+            item[0] += stat.st_size
+            if ext == ".body":
+                item[1] = stat.st_mtime
+    except OSError:
+        return 0
+    total = sum(size for size, _ in entries.values())
+    evicted = 0
+    for key, (size, _) in sorted(entries.items(), key=lambda kv: kv[1][1]):
+        if total <= max_bytes:
+            break
+        for ext in (".json", ".body"):
+            try:
+                os.remove(os.path.join(config.HTTP_CACHE_DIR, key + ext))
+            except OSError:
+                pass
+        total -= size
+        evicted += 1
+    if evicted:
+        count("http_cache_evicted", evicted)
+    return total
+
+def cache_store(url, resp):
+    '''Keep a 200 response on disk, evicting least recently used entries past HTTP_CACHE_MAX_BYTES.'''
+    if "no-store" in resp.headers.get("Cache-Control", ""):
+        return
+    meta_path, body_path = _cache_paths(url)
+    meta = {
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "content_type": resp.headers.get("Content-Type", ""),
+        "encoding": resp.encoding,
+        "stored_at": time.time(),
+    }
+    try:
+        os.makedirs(config.HTTP_CACHE_DIR, exist_ok=True)
+        atomic_write(body_path, resp.content)
+        atomic_write(meta_path, json.dumps(meta), mode="w")
+    except Exception:
+        return
+    with _cache_bytes["lock"]:
+        # the running total only overestimates (overwritten entries count twice); a scan corrects it
+        added = len(resp.content) + len(json.dumps(meta))
+        if _cache_bytes["total"] is None or _cache_bytes["total"] + added > config.HTTP_CACHE_MAX_BYTES:
+            _cache_bytes["total"] = _prune_http_cache(config.HTTP_CACHE_MAX_BYTES)
+        else:
+            _cache_bytes["total"] += added
+
+def _cache_touch(url, meta):
+    _mark_used(url)
+    meta["stored_at"] = time.time()
+    try:
+        atomic_write(_cache_paths(url)[0], json.dumps(meta), mode="w")
+    except Exception:
+        pass
+
+def _cached_response(url, meta, body):
+    '''Rebuild a requests.Response from a cache entry so callers need not care.'''
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = body
+    resp.encoding = meta.get("encoding")
+    resp.headers = CaseInsensitiveDict({"Content-Type": meta.get("content_type", "")})
+    resp.from_cache = True
+    return resp
+
+def _is_fresh(meta):
+    '''Entries without validators are served without a request until the TTL runs out.'''
+    if meta.get("etag") or meta.get("last_modified"):
+        return False
+    return time.time() - meta.get("stored_at", 0) < config.HTTP_CACHE_TTL
+
+# ----------------------------
+# Retry policy & circuit breaker
+# ----------------------------
+_circuit = None
+_circuit_lock = threading.Lock()
+
+def _load_circuit():
+    global _circuit
+    if _circuit is None:
+        try:
+            with open(config.CIRCUIT_FILE, "r") as f:
+                _circuit = json.load(f)
+        except Exception:
+            _circuit = {}
+    return _circuit
+
+def _save_circuit():
+    try:
+        atomic_write(config.CIRCUIT_FILE, json.dumps(_circuit), mode="w")
+    except Exception:
+        pass
+
+def circuit_state(url):
+    '''
+    "closed" (normal), "open" (skip host) or "half-open" (cooldown over).
+    Half-open is returned to a single caller, which becomes the host's
+    probe: concurrent callers get "open" until the probe's result is
+    recorded with record_fetch_result (or CIRCUIT_PROBE_TIMEOUT passes).
+    '''
+    now = time.time()
+    with _circuit_lock:
+        entry = _load_circuit().get(host_of(url))
+        if not entry or entry.get("failures", 0) < config.CIRCUIT_FAILURE_THRESHOLD:
+            return "closed"
+        if now - entry.get("opened_at", 0) < config.CIRCUIT_COOLDOWN:
+            return "open"
+        if now - entry.get("probing_since", 0) < config.CIRCUIT_PROBE_TIMEOUT:
+            return "open"
+        entry["probing_since"] = now
+    return "half-open"
+
+def record_fetch_result(url, ok):
+    '''Reset a host's failure count on success; trip the breaker after repeated failures.'''
+    host = host_of(url)
+    with _circuit_lock:
+        state = _load_circuit()
+        entry = state.get(host)
+        if ok:
+            if entry:
+                del state[host]
+                _save_circuit()
+            return
+        entry = entry or {"failures": 0}
+        entry["failures"] += 1
+        entry.pop("probing_since", None)
+        if entry["failures"] >= config.CIRCUIT_FAILURE_THRESHOLD:
+            entry["opened_at"] = time.time()
+        state[host] = entry
+        _save_circuit()
+
+def retry_after_seconds(resp):
+    '''Parse a Retry-After header (delta-seconds or HTTP-date); None if absent or invalid.'''
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except Exception:
+        return None
+
+def backoff_delay(attempt, base):
+    '''Exponential backoff with jitter: a random delay in [d/2, d], d = base * 2**attempt.'''
+    delay = min(config.RETRY_MAX_DELAY, base * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+def safe_get(url, tries=3, backoff=1, timeout=12, use_cache=True, revalidate=False):
+    '''
+    Robust GET with retries and headers, over a pooled per-host session.
+    With `use_cache`, responses are kept on disk and revalidated with
+    If-None-Match / If-Modified-Since; a 304 returns the cached body.
+    Entries without validators are served unrequested within
+    HTTP_CACHE_TTL unless `revalidate` (a forced refresh) is set.
+    Only timeouts, connection errors and RETRY_STATUSES are retried; hosts
+    whose circuit is open are skipped. Returns None on failure.
+    '''
+    session = get_session(url)
+    host = host_of(url)
+    meta, body = cache_load(url) if use_cache else (None, None)
+    cond_headers = {}
+    if meta:
+        if not revalidate and _is_fresh(meta):
+            _count_cache("hits")
+            _mark_used(url)
+            return _cached_response(url, meta, body)
+        if meta.get("etag"):
+            cond_headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            cond_headers["If-Modified-Since"] = meta["last_modified"]
+    state = circuit_state(url)
+    if state == "open":
+        count("http_skipped", host=host)
+        return None
+    if state == "half-open":
+        tries = 1
+    error = None
+    for attempt in range(tries):
+        resp = None
+        try:
+            with host_slot(url):
+                resp = session.get(url, headers=cond_headers, timeout=timeout)
+        except requests.RequestException as e:
+            error = e
+        if resp is not None:
+            if resp.status_code == 304 and meta:
+                record_fetch_result(url, True)
+                _count_cache("revalidated")
+                _cache_touch(url, meta)
+                return _cached_response(url, meta, body)
+            if resp.status_code == 200:
+                record_fetch_result(url, True)
+                count("http_bytes", len(resp.content), host=host)
+                if use_cache:
+                    _count_cache("misses")
+                    cache_store(url, resp)
+                return resp
+            error = f"HTTP {resp.status_code}"
+            if resp.status_code not in config.RETRY_STATUSES:
+                # permanent (404, 403, ...): the host is up, the url is not worth retrying
+                record_fetch_result(url, True)
+                log_error("fetch", error, host=host, url=url)
+                return None
+        if attempt == tries - 1:
+            break
+        delay = retry_after_seconds(resp)
+        if delay is None:
+            delay = backoff_delay(attempt, backoff)
+        elif delay > config.RETRY_MAX_DELAY:
+            break
+        count("http_retries", host=host)
+        time.sleep(delay)
+    record_fetch_result(url, False)
+    log_error("fetch", error or "retry delay too long", host=host, url=url, attempts=attempt + 1)
+    return None
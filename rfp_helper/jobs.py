@@ -0,0 +1,276 @@
+'''
+Background analysis jobs: a queue in the tender store and a process-pool
+worker that runs download -> extract -> match off the UI thread. Identical
+jobs (same document, mode and catalog) share one row, so a document is
+analysed once however many sessions and prefetches ask for it, and any
+process can poll a job's status by its key.
+'''
+import json
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from . import config
+from .documents import document_url
+from .matching import catalog_version, record_document_fit
+from .metrics import count, log_error, record_span, span
+from .scoring import merge_near_duplicates
+from .search import index_document_text
+from .store import query_tenders, store_connect, tender_key
+from .util import process_pool
+
+# In-process worker shared by every session and rerun of this server process
+_worker = {"lock": threading.Lock(), "thread": None}
+
+def job_key(doc_link, full=False, catalog=None, line_items=False):
+    '''Identity of an analysis job: catalog version, extraction mode and document URL.'''
+    catalog = config.product_db if catalog is None else catalog
+    mode = "boq" if line_items else "full" if full else "preview"
+    return f"{catalog_version(catalog)}:{mode}:{doc_link}"
+
+def submit_job(doc_link, full=False, tender=None, priority=0, retry=False, start_worker=True, line_items=False):
+    '''
+    Queue analysis of the document at `doc_link` unless an identical job is
+    already queued, running or done; a failed one is queued again only with
+    `retry`. With `line_items` the job also extracts and matches the whole
+    bill of quantities. A resubmission keeps the higher of the two
+    priorities. Starts the in-process worker unless `start_worker` is False
+    (e.g. when a `python -m rfp_helper worker` process serves the queue).
+    Returns the job key to poll with job_status.
+    '''
+    key = job_key(doc_link, full, line_items=line_items)
+    now = time.time()
+    conn = store_connect()
+    try:
+        with conn:
+            row = conn.execute("SELECT status FROM analysis_jobs WHERE job_key = ?", (key,)).fetchone()
+            if row is None:
+                conn.execute(
+                    '''INSERT INTO analysis_jobs (job_key, doc_link, full, line_items, catalog_version, tender_key,
+                                                  priority, status, submitted_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?)''',
+                    (key, doc_link, int(bool(full)), int(bool(line_items)), key.split(":", 1)[0],
+                     tender_key(tender) if tender is not None else None, priority, now),
+                )
+                count("analysis_jobs", result="queued")
+            elif row["status"] == "failed" and retry:
+                conn.execute(
+                    '''UPDATE analysis_jobs SET status = 'queued', attempts = 0, error = NULL, result = NULL,
+                                                priority = MAX(priority, ?), submitted_at = ?
+                       WHERE job_key = ?''',
+                    (priority, now, key),
+                )
+                count("analysis_jobs", result="retried")
+            else:
+                conn.execute("UPDATE analysis_jobs SET priority = MAX(priority, ?) WHERE job_key = ?", (priority, key))
+                count("analysis_jobs", result="deduplicated")
+    finally:
+        conn.close()
+    if start_worker:
+        ensure_worker()
+    return key
+
+def job_status(key):
+    '''
+    State of a job as a dict: "status" (queued, running, done, failed, or
+    None for an unknown key) and "error"; queued jobs add their "position"
+    in the queue, done jobs the "text", "match" and "doc_sha" of the
+    analysis, and "line_items" for bill of quantities jobs.
+    '''
+    conn = store_connect()
+    try:
+        row = conn.execute("SELECT * FROM analysis_jobs WHERE job_key = ?", (key,)).fetchone()
+        if row is None:
+            return {"status": None, "error": None}
+        job = {"status": row["status"], "error": row["error"]}
+        if row["status"] == "queued":
+            job["position"] = conn.execute(
+                '''SELECT COUNT(*) FROM analysis_jobs WHERE status = 'queued'
+                   AND (priority > ? OR (priority = ? AND submitted_at < ?))''',
+                (row["priority"], row["priority"], row["submitted_at"]),
+            ).fetchone()[0] + 1
+        elif row["status"] == "done":
+            job.update(json.loads(row["result"]))
+        return job
+    finally:
+        conn.close()
+
+def queue_summary():
+    '''Number of jobs per status.'''
+    conn = store_connect()
+    try:
+        return {r["status"]: r["n"] for r in
+                conn.execute("SELECT status, COUNT(*) AS n FROM analysis_jobs GROUP BY status")}
+    finally:
+        conn.close()
+
+def prefetch_top_tenders(top=None, full=False, start_worker=True):
+    '''
+    Queue the `top` (PREFETCH_TOP_TENDERS) best-scored active tenders that
+    link a document, prioritised by score, so their analysis is ready
+    before anyone opens them. A tender cross-listed on several portals is
+    queued once. Returns the job keys.
+    '''
+    top = top or config.PREFETCH_TOP_TENDERS
+    df = merge_near_duplicates(query_tenders(limit=top * 3))
+    tenders = [t for t in df.to_dict("records") if document_url(t)][:top]
+    keys = [submit_job(document_url(t), full, tender=t, priority=float(t.get("Score") or 0), start_worker=False)
+            for t in tenders]
+    if keys and start_worker:
+        ensure_worker()
+    return keys
+
+# ----------------------------
+# Worker
+# ----------------------------
+def run_job(doc_link, full=False, line_items=False):
+    '''Download, extract and match one document. Runs in a worker process.'''
+    from .boq import extract_boq
+    from .documents import download_rfp
+    from .matching import analyze_document, document_sha
+    with span("analysis_job", full=full, line_items=line_items) as timing:
+        path = download_rfp(doc_link)
+        if not path:
+            timing["ok"] = False
+            return {"status": "failed", "error": "Could not download the document."}
+        text, match = analyze_document(path, max_chars=None if full else config.PDF_PREVIEW_CHARS, filename=path)
+        result = {"status": "done", "doc_sha": document_sha(path), "text": text, "match": match}
+        if line_items:
+            # pool processes cannot start pools of their own
+            result["line_items"] = extract_boq(path, filename=path, workers=1)
+        return result
+
+def _claim_jobs(limit):
+    '''Mark up to `limit` queued jobs running, highest priority first, and return them.'''
+    now = time.time()
+    conn = store_connect()
+    try:
+        with conn:
+            # jobs whose worker died (or hung) go back to the queue, a bounded number of times
+            conn.execute(
+                '''UPDATE analysis_jobs
+                   SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+                       error = CASE WHEN attempts < ? THEN error ELSE 'Analysis timed out.' END
+                   WHERE status = 'running' AND started_at < ?''',
+                (config.JOB_MAX_ATTEMPTS, config.JOB_MAX_ATTEMPTS, now - config.JOB_TIMEOUT),
+            )
+            rows = conn.execute(
+                '''UPDATE analysis_jobs SET status = 'running', started_at = ?, attempts = attempts + 1
+                   WHERE job_key IN (SELECT job_key FROM analysis_jobs WHERE status = 'queued'
+                                     ORDER BY priority DESC, submitted_at LIMIT ?)
+                   RETURNING job_key, doc_link, full, line_items, tender_key, submitted_at''',
+                (now, limit),
+            ).fetchall()
+        for r in rows:
+            record_span("job_queue_wait", now - r["submitted_at"])
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+def _finish_job(job, result):
+    conn = store_connect()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE analysis_jobs SET status = ?, error = ?, result = ?, finished_at = ? WHERE job_key = ?",
+                (result["status"], result.get("error"),
+                 json.dumps({k: v for k, v in result.items() if k not in ("status", "error")}),
+                 time.time(), job["job_key"]),
+            )
+    finally:
+        conn.close()
+    count("analysis_jobs", result=result["status"])
+    if result["status"] == "done" and job.get("tender_key"):
+        # the tender becomes findable by words of its document, and ranked by how well it matches
+        try:
+            index_document_text(job["tender_key"], result.get("text"))
+            record_document_fit(job["tender_key"], result.get("doc_sha"), result["match"])
+        except Exception as e:
+            log_error("tender_document", e, url=job["doc_link"])
+
+def _release_jobs(jobs):
+    '''Put claimed jobs that never started back in the queue.'''
+    conn = store_connect()
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE analysis_jobs SET status = 'queued', attempts = attempts - 1 WHERE job_key = ?",
+                [(j["job_key"],) for j in jobs],
+            )
+    finally:
+        conn.close()
+
+def run_worker(workers=None, poll=None, idle_exit=None):
+    '''
+    Process queued jobs on a pool of `workers` (JOB_WORKERS) processes until
+    the queue has been empty for `idle_exit` seconds, or forever when None.
+    Several workers, in one process or many, can share the queue: jobs are
+    claimed atomically. Returns the number of jobs finished.
+    '''
+    workers = workers or config.JOB_WORKERS
+    poll = poll or config.JOB_POLL_INTERVAL
+    finished, running, idle_since = 0, {}, time.time()
+    with process_pool(workers) as pool:
+        while True:
+            claimed = _claim_jobs(workers - len(running)) if len(running) < workers else []
+            for n, job in enumerate(claimed):
+                try:
+                    running[pool.submit(run_job, job["doc_link"], bool(job["full"]), bool(job["line_items"]))] = job
+                except BrokenProcessPool:
+                    _release_jobs(claimed[n:] + list(running.values()))
+                    return finished
+            if not running:
+                if idle_exit is not None and time.time() - idle_since >= idle_exit:
+                    return finished
+                time.sleep(poll)
+                continue
+            done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+            for fut in done:
+                job = running.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    log_error("job", e, url=job["doc_link"])
+                    result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                _finish_job(job, result)
+                finished += 1
+            idle_since = time.time()
+
+def _has_queued_jobs():
+    return queue_summary().get("queued", 0) > 0
+
+def ensure_worker():
+    '''
+    Start the in-process worker thread unless it is running. It stops once
+    the queue has been idle for JOB_IDLE_EXIT seconds; the next submission
+    starts it again.
+    '''
+    w = _worker
+    with w["lock"]:
+        if w["thread"] is not None:
+            return False
+
+        def run():
+            while True:
+                try:
+                    run_worker(idle_exit=config.JOB_IDLE_EXIT)
+                except Exception as e:
+                    log_error("job_worker", e)
+                    time.sleep(config.JOB_POLL_INTERVAL)
+                # decide under the lock, so a job queued meanwhile is never left without a worker
+                with w["lock"]:
+                    try:
+                        pending = _has_queued_jobs()
+                    except Exception:
+                        pending = False
+                    if not pending:
+                        w["thread"] = None
+                        return
+
+        w["thread"] = threading.Thread(target=run, name="analysis-worker", daemon=True)
+        w["thread"].start()
+        return True
+
+def worker_running():
+    return _worker["thread"] is not None
@@ -0,0 +1,337 @@
+'''
+Technical matching of tender text against the product catalog (TF-IDF),
+the product fit of stored tenders, and the analysis cache that memoises
+extracted text and match results by document hash.
+'''
+import hashlib
+import json
+import math
+import os
+import pickle
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from . import config
+from .documents import extract_pdf_text_parallel_with_offsets, extract_pdf_text_with_offsets, \
+    extract_spreadsheet_text_with_offsets
+from .metrics import count, log_error, span
+from .store import store_connect
+from .util import atomic_write
+
+PRODUCT_INDEXES_KEPT = 4      # catalog versions whose fitted index stays in memory
+MATCH_VERSION = "2"           # bump when match scores change, so stored fits and cached matches are redone
+
+# ----------------------------
+# Relevance / Technical matching
+# ----------------------------
+_product_indexes = {}         # catalog version -> index, least recently used first
+_product_index_lock = threading.Lock()
+
+def catalog_version(catalog):
+    '''Content hash of the catalog (and MATCH_VERSION); the index is rebuilt whenever it changes.'''
+    h = hashlib.sha256(MATCH_VERSION.encode("utf-8") + b"\0")
+    for product in catalog:
+        h.update(product.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+def build_product_index(catalog):
+    '''Fit TF-IDF over the catalog once and persist it to PRODUCT_INDEX_FILE.'''
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer()
+    index = {
+        "version": catalog_version(catalog),
+        "vectorizer": vectorizer,
+        # rows are L2-normalised, so a dot product with a query vector is the cosine
+        "matrix": vectorizer.fit_transform(catalog).tocsr(),
+    }
+    try:
+        atomic_write(config.PRODUCT_INDEX_FILE, pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        pass
+    return index
+
+def _load_product_index(version):
+    try:
+        with open(config.PRODUCT_INDEX_FILE, "rb") as f:
+            index = pickle.load(f)
+        if index.get("version") == version:
+            return index
+    except Exception:
+        pass
+    return None
+
+def get_product_index(catalog):
+    '''Product index for `catalog`: from memory, then disk, fitting it only if the catalog changed.'''
+    version = catalog_version(catalog)
+    with _product_index_lock:
+        index = _product_indexes.pop(version, None)
+        if index is None:
+            index = _load_product_index(version) or build_product_index(catalog)
+        _product_indexes[version] = index
+        while len(_product_indexes) > PRODUCT_INDEXES_KEPT:
+            del _product_indexes[next(iter(_product_indexes))]
+        return index
+
+def product_sku(idx):
+    '''Demo SKU of the catalog entry at position `idx`.'''
+    return f"SKU-{1001 + idx}"
+
+def top_k_indices(scores, k):
+    '''Indices of the k largest scores, best first, via partial selection.'''
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=int)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+def query_coverage(index, texts):
+    '''
+    Share of each text's full TF-IDF norm that falls on words of the
+    catalog vocabulary. transform() drops every other word, so without this
+    factor they would no longer dilute the cosine the way they did when
+    TF-IDF was fit over the query and catalog together; scaling by it keeps
+    percentages (and the thresholds built on them) on that scale.
+    '''
+    vectorizer = index["vectorizer"]
+    analyzer = vectorizer.build_analyzer()
+    vocab, idf = vectorizer.vocabulary_, vectorizer.idf_
+    # smoothed IDF of a word found in no catalog entry
+    oov_idf = math.log(1 + index["matrix"].shape[0]) + 1
+    coverage = np.zeros(len(texts))
+    for i, text in enumerate(texts):
+        known = full = 0.0
+        for word, tf in Counter(analyzer(text or "")).items():
+            j = vocab.get(word)
+            weight = (tf * (idf[j] if j is not None else oov_idf)) ** 2
+            full += weight
+            if j is not None:
+                known += weight
+        coverage[i] = math.sqrt(known / full) if full else 0.0
+    return coverage
+
+def batch_relevance(texts, catalog):
+    '''
+    Match many texts against the catalog in one sparse matrix product.
+    Returns (best_idx, best_score) arrays, scores being cosine in [0, 1]
+    scaled by query_coverage.
+    '''
+    with span("match_batch", texts=len(texts)):
+        index = get_product_index(catalog)
+        texts = [t or "" for t in texts]
+        queries = index["vectorizer"].transform(texts)
+        sims = (queries @ index["matrix"].T).tocsr()
+        best_idx = np.asarray(sims.argmax(axis=1)).ravel()
+        best_score = sims.max(axis=1).toarray().ravel() * query_coverage(index, texts)
+    return best_idx, best_score
+
+def check_relevance(user_text, product_db, k=3):
+    with span("match") as timing:
+        index = get_product_index(product_db)
+        try:
+            query = index["vectorizer"].transform([user_text or ""])
+            match_scores = (index["matrix"] @ query.T).toarray().ravel() * query_coverage(index, [user_text])[0]
+        except Exception as e:
+            # if vectorization fails (e.g., tiny text), return zeros
+            timing["ok"] = False
+            log_error("match", e)
+            match_scores = np.zeros(len(product_db))
+    top_idx = top_k_indices(match_scores, k)
+    best_idx = int(top_idx[0])
+    percents = np.round(match_scores * 100, 2)
+    return {
+        "most_relevant": product_db[best_idx],
+        "relevance_percent": float(percents[best_idx]),
+        "top_3": [(product_db[i], float(percents[i])) for i in top_idx],
+        "all_scores": dict(zip(product_db, percents.tolist()))
+    }
+
+# ----------------------------
+# Analysis cache (extracted text & match results)
+# ----------------------------
+def document_sha(doc):
+    '''SHA-256 of a document given as bytes or a path; content-addressed paths are not re-read.'''
+    if isinstance(doc, (bytes, bytearray)):
+        return hashlib.sha256(doc).hexdigest()
+    stem = os.path.splitext(os.path.basename(doc))[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return stem
+    hasher = hashlib.sha256()
+    with open(doc, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def analysis_cache_get(doc_sha, kind, version):
+    conn = store_connect()
+    try:
+        row = conn.execute(
+            "SELECT payload FROM analysis_cache WHERE doc_sha = ? AND kind = ? AND version = ?",
+            (doc_sha, kind, version),
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE analysis_cache SET last_access = ? WHERE doc_sha = ? AND kind = ? AND version = ?",
+                (time.time(), doc_sha, kind, version),
+            )
+        return json.loads(row["payload"])
+    finally:
+        conn.close()
+
+def analysis_cache_put(doc_sha, kind, version, payload, max_bytes=config.ANALYSIS_CACHE_MAX_BYTES):
+    '''
+    Store a JSON payload, then evict least recently used entries until the
+    cache is back under `max_bytes`. Match results for other catalog
+    versions are dropped: they can never be hit again.
+    '''
+    data = json.dumps(payload)
+    conn = store_connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (doc_sha, kind, version, payload, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_sha, kind, version, data, len(data), time.time()),
+            )
+            if kind == "match":
+                conn.execute("DELETE FROM analysis_cache WHERE kind = 'match' AND version != ?", (version,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+            if total > max_bytes:
+                evict = []
+                for row in conn.execute("SELECT doc_sha, kind, version, size FROM analysis_cache ORDER BY last_access"):
+                    if total <= max_bytes:
+                        break
+                    evict.append((row["doc_sha"], row["kind"], row["version"]))
+                    total -= row["size"]
+                conn.executemany("DELETE FROM analysis_cache WHERE doc_sha = ? AND kind = ? AND version = ?", evict)
+    finally:
+        conn.close()
+
+def is_spreadsheet(filename):
+    return bool(filename) and filename.lower().endswith((".xls", ".xlsx"))
+
+def cached_document_text(doc, max_chars=config.PDF_PREVIEW_CHARS, doc_sha=None, filename=""):
+    '''
+    Extracted text of a PDF or spreadsheet (bytes or path), its section
+    offsets (PDF pages / sheets) and the PDF pages that could not be read,
+    memoised by content hash. Whole PDFs (`max_chars` None) are read on a
+    process pool with PDF_PAGE_TIMEOUT per page, so one bad page is
+    skipped instead of hanging the caller.
+    '''
+    doc_sha = doc_sha or document_sha(doc)
+    sheet = is_spreadsheet(filename)
+    version = f"{'sheet' if sheet else 'pdf'}:{max_chars or 'full'}"
+    hit = analysis_cache_get(doc_sha, "text", version)
+    if hit is not None:
+        count("analysis_cache", result="hit", kind="text")
+        return hit["text"], dict((k, off) for k, off in hit["offsets"]), hit.get("skipped", [])
+    count("analysis_cache", result="miss", kind="text")
+    skipped = []
+    if not sheet and not max_chars:
+        text, offsets, skipped = extract_pdf_text_parallel_with_offsets(doc)
+    else:
+        with span("sheet_preview" if sheet else "pdf_preview") as timing:
+            if sheet:
+                text, offsets = extract_spreadsheet_text_with_offsets(doc, filename, max_chars=max_chars)
+            else:
+                text, offsets = extract_pdf_text_with_offsets(doc, max_chars)
+            timing["chars"] = len(text)
+    analysis_cache_put(doc_sha, "text", version, {"text": text, "offsets": list(offsets.items()), "skipped": skipped})
+    return text, offsets, skipped
+
+def cached_relevance(doc_sha, text, catalog):
+    '''check_relevance, memoised per document and catalog version.'''
+    version = catalog_version(catalog)
+    hit = analysis_cache_get(doc_sha, "match", version)
+    if hit is not None:
+        return hit
+    match = check_relevance(text, catalog)
+    analysis_cache_put(doc_sha, "match", version, match)
+    return match
+
+def analyze_document(doc, catalog=None, max_chars=config.PDF_PREVIEW_CHARS, filename=""):
+    '''
+    Extract a PDF's (or, by `filename`, a spreadsheet's) text and match it
+    against the catalog, reusing earlier results for the same content.
+    Returns (text, match); match["skipped_pages"] lists the PDF pages a
+    whole-document read had to skip. Unreadable documents are reported in
+    `text` and not cached.
+    '''
+    catalog = config.product_db if catalog is None else catalog
+    try:
+        doc_sha = document_sha(doc)
+        text, _, skipped = cached_document_text(doc, max_chars, doc_sha=doc_sha, filename=filename)
+    except Exception as e:
+        log_error("analyze", e, filename=filename)
+        if is_spreadsheet(filename):
+            text = f"Error reading file: {e}"
+        else:
+            text = "Could not reliably extract PDF text (file might be scanned or protected)."
+        return text, dict(check_relevance(text, catalog), skipped_pages=[])
+    return text, dict(cached_relevance(doc_sha, text, catalog), skipped_pages=skipped)
+
+# ----------------------------
+# Product fit of stored tenders
+# ----------------------------
+def _cached_text_by_sha(conn, doc_sha):
+    '''Most recently used extracted text of a document, or None once evicted from the analysis cache.'''
+    row = conn.execute(
+        "SELECT payload FROM analysis_cache WHERE doc_sha = ? AND kind = 'text' ORDER BY last_access DESC LIMIT 1",
+        (doc_sha,),
+    ).fetchone()
+    return json.loads(row["payload"])["text"] if row else None
+
+def refresh_product_fit(catalog=None):
+    '''
+    Batch-match every stored tender whose product fit is missing or was
+    computed against another catalog version, and store "Product Fit" (%)
+    and "Best Product". Tenders whose document was analysed are matched on
+    its extracted text while the analysis cache still holds it, otherwise
+    on their title. Returns the number of tenders rescored.
+    '''
+    catalog = config.product_db if catalog is None else catalog
+    version = catalog_version(catalog)
+    conn = store_connect()
+    try:
+        stale = conn.execute(
+            "SELECT id, title, fit_doc_sha FROM tenders WHERE fit_version IS NULL OR fit_version != ?", (version,)
+        ).fetchall()
+        if not stale:
+            return 0
+        texts = [(r["fit_doc_sha"] and _cached_text_by_sha(conn, r["fit_doc_sha"])) or r["title"] for r in stale]
+        best_idx, best_score = batch_relevance(texts, catalog)
+        with conn:
+            conn.executemany(
+                "UPDATE tenders SET product_fit = ?, best_product = ?, fit_version = ? WHERE id = ?",
+                [
+                    (round(float(score) * 100, 2), catalog[int(idx)] if score > 0 else None, version, r["id"])
+                    for r, idx, score in zip(stale, best_idx, best_score)
+                ],
+            )
+        return len(stale)
+    finally:
+        conn.close()
+
+def record_document_fit(key, doc_sha, match, catalog=None):
+    '''
+    Store the match of a tender's analysed document (check_relevance
+    output) as the "Product Fit" and "Best Product" of the tender with key
+    `key`: the document tells far more about what is wanted than the title.
+    '''
+    if not key:
+        return
+    catalog = config.product_db if catalog is None else catalog
+    conn = store_connect()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE tenders SET product_fit = ?, best_product = ?, fit_version = ?, fit_doc_sha = ? WHERE tender_key = ?",
+                (match["relevance_percent"], match["most_relevant"] if match["relevance_percent"] > 0 else None,
+                 catalog_version(catalog), doc_sha, key),
+            )
+    finally:
+        conn.close()
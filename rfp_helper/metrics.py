@@ -0,0 +1,165 @@
+'''
+Instrumentation: timing spans and counters per stage and portal, a JSON
+event log and a Prometheus text export.
+'''
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from . import config
+from .util import atomic_write
+
+# Counters and span samples shared by every session, rerun and worker thread of this process
+_metrics = {"lock": threading.Lock(), "counters": {}, "spans": {}}
+
+def log_event(event, **fields):
+    '''Append one JSON line to METRICS_LOG_FILE. Instrumentation never raises.'''
+    line = json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str) + "\n"
+    with _metrics["lock"]:
+        try:
+            if os.path.exists(config.METRICS_LOG_FILE) and os.path.getsize(config.METRICS_LOG_FILE) > config.METRICS_LOG_MAX_BYTES:
+                os.replace(config.METRICS_LOG_FILE, config.METRICS_LOG_FILE + ".1")
+            with open(config.METRICS_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
+        except Exception:
+            pass
+
+def count(name, value=1, **labels):
+    '''Add `value` to the counter `name` for the given labels (portal, host, ...).'''
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None)))
+    with _metrics["lock"]:
+        _metrics["counters"][key] = _metrics["counters"].get(key, 0) + value
+
+def record_span(stage, seconds, portal=None, ok=True, **fields):
+    '''Record one timed stage: kept for percentiles and written to the event log.'''
+    key = (stage, portal or "")
+    with _metrics["lock"]:
+        entry = _metrics["spans"].get(key)
+        if entry is None:
+            entry = _metrics["spans"][key] = {"count": 0, "sum": 0.0, "errors": 0, "samples": deque(maxlen=config.METRICS_SAMPLES)}
+        entry["count"] += 1
+        entry["sum"] += seconds
+        entry["errors"] += 0 if ok else 1
+        entry["samples"].append(seconds)
+    log_event("span", stage=stage, portal=portal, seconds=round(seconds, 6), ok=ok, **fields)
+
+@contextmanager
+def span(stage, portal=None, **fields):
+    '''
+    Time the enclosed block as `stage`. The yielded dict collects extra
+    fields for the log line; setting its "ok" to False marks a handled
+    failure. An exception marks the span failed and propagates.
+    '''
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield fields
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        ok = fields.pop("ok", True) and ok
+        record_span(stage, time.perf_counter() - start, portal, ok, **fields)
+
+def log_error(stage, error, portal=None, **fields):
+    '''Count and log an error that the caller is about to swallow.'''
+    count("errors", stage=stage, portal=portal)
+    message = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+    log_event("error", stage=stage, portal=portal, error=message[:500], **fields)
+
+def _prom_labels(labels):
+    labels = [(k, v) for k, v in labels if v]
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+def metrics_prometheus():
+    '''Counters and stage latencies of this process in the Prometheus text exposition format.'''
+    with _metrics["lock"]:
+        counters = dict(_metrics["counters"])
+        spans = {k: (v["count"], v["sum"], v["errors"], list(v["samples"])) for k, v in _metrics["spans"].items()}
+    lines = []
+    by_name = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, series in by_name.items():
+        lines.append(f"# TYPE rfp_{name}_total counter")
+        lines.extend(f"rfp_{name}_total{_prom_labels(labels)} {value:.6f}" if isinstance(value, float)
+                     else f"rfp_{name}_total{_prom_labels(labels)} {value}" for labels, value in series)
+    if spans:
+        import numpy as np
+        lines.append("# TYPE rfp_stage_seconds summary")
+        for (stage, portal), (n, total, _, samples) in sorted(spans.items()):
+            labels = (("stage", stage), ("portal", portal))
+            for q, v in zip((0.5, 0.9, 0.99), np.quantile(samples, (0.5, 0.9, 0.99))):
+                lines.append(f"rfp_stage_seconds{_prom_labels(labels + (('quantile', str(q)),))} {v:.6f}")
+            lines.append(f"rfp_stage_seconds_sum{_prom_labels(labels)} {total:.6f}")
+            lines.append(f"rfp_stage_seconds_count{_prom_labels(labels)} {n}")
+        lines.append("# TYPE rfp_stage_failures_total counter")
+        lines.extend(
+            f"rfp_stage_failures_total{_prom_labels((('stage', stage), ('portal', portal)))} {errors}"
+            for (stage, portal), (_, _, errors, _) in sorted(spans.items())
+        )
+    return "\n".join(lines) + "\n"
+
+def export_prometheus():
+    '''Rewrite METRICS_PROM_FILE (e.g. for node_exporter's textfile collector).'''
+    try:
+        atomic_write(config.METRICS_PROM_FILE, metrics_prometheus(), mode="w")
+    except Exception:
+        pass
+
+def read_metric_events(limit=20000):
+    '''The latest `limit` events of METRICS_LOG_FILE, oldest first.'''
+    try:
+        with open(config.METRICS_LOG_FILE, "r", encoding="utf-8") as f:
+            lines = deque(f, maxlen=limit)
+    except OSError:
+        return []
+    events = []
+    for line in lines:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events
+
+def latency_percentiles(events):
+    '''p50/p90/p99 seconds, calls and failures per stage and portal from logged spans.'''
+    import pandas as pd
+    spans = pd.DataFrame([e for e in events if e.get("event") == "span"])
+    if spans.empty:
+        return spans
+    spans["portal"] = spans["portal"].fillna("")
+    grouped = spans.groupby(["stage", "portal"])
+    out = grouped["seconds"].quantile([0.5, 0.9, 0.99]).unstack()
+    out.columns = ["p50", "p90", "p99"]
+    out["calls"] = grouped.size()
+    out["failures"] = grouped["ok"].apply(lambda ok: int((~ok.astype(bool)).sum()))
+    return out.reset_index()
+
+def run_summaries(events, limit=config.METRICS_RUNS_SHOWN):
+    '''One row per logged scrape run, most recent first.'''
+    import pandas as pd
+    rows = []
+    for run in reversed([e for e in events if e.get("event") == "run"][-limit:]):
+        portals = run.get("portals", {}).values()
+        rows.append({
+            "Started": datetime.fromtimestamp(run["ts"] - run.get("seconds", 0)).strftime("%Y-%m-%d %H:%M:%S"),
+            "Seconds": run.get("seconds"),
+            "Mode": "incremental" if run.get("incremental") else "full",
+            "Tenders": run.get("tenders"),
+            "Pages": sum(p["pages"] for p in portals),
+            "Rows seen": sum(p["rows_seen"] for p in portals),
+            "Rows kept": sum(p["rows_kept"] for p in portals),
+            "Failed pages": sum(p["failed"] for p in portals),
+            "KB fetched": round(sum(p["bytes"] for p in portals) / 1024, 1),
+            "Cache hits": sum(p["cached"] for p in portals),
+            "Abandoned": run.get("abandoned", 0),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,47 @@
+'''
+Process-pool worker for PDF text extraction.
+
+Kept in its own small module so that child processes import only
+pdfplumber, not the rest of the pipeline.
+'''
+import signal
+
+import pdfplumber
+
+
+class PageTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise PageTimeout()
+
+
+def extract_page_range(pdf_path, start, stop, page_timeout=None):
+    '''
+    Extract pages [start, stop) of the PDF at `pdf_path`.
+    Returns [(page_number, text)], text being None for a page that failed or
+    ran longer than `page_timeout` seconds (enforced with SIGALRM where the
+    platform has it).
+    '''
+    use_alarm = bool(page_timeout) and hasattr(signal, "setitimer")
+    previous = signal.signal(signal.SIGALRM, _on_alarm) if use_alarm else None
+    out = []
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            for n in range(start, min(stop, len(pdf.pages))):
+                page = pdf.pages[n]
+                try:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                    out.append((n, page.extract_text() or ""))
+                except Exception:
+                    out.append((n, None))
+                finally:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                    page.close()
+    finally:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous)
+    return out
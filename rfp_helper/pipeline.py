@@ -0,0 +1,112 @@
+'''
+Headless pipeline: scrape -> download -> extract -> match -> price, for one
+tender or for many in parallel, with results written to the store.
+'''
+from concurrent.futures import as_completed
+
+from . import config
+from .documents import document_url, download_rfp
+from .matching import analyze_document, document_sha, record_document_fit, refresh_product_fit
+from .metrics import log_error, log_event, span
+from .pricing import DUMMY_TEST_PRICES, pricing_agent_build, recommendation_table
+from .scoring import merge_near_duplicates
+from .search import index_document_text
+from .store import query_tenders, save_analysis, tender_key
+from .util import process_pool
+
+DEFAULT_TESTS = list(DUMMY_TEST_PRICES)[:2]   # same default selection as the UI
+
+def analyze_and_price(doc, catalog=None, tests=None, full=False, filename=""):
+    '''
+    Extract, match and price one document (bytes or a local path).
+    Returns (text, match, price_rows DataFrame, total_material, total_services).
+    '''
+    catalog = config.product_db if catalog is None else catalog
+    tests = DEFAULT_TESTS if tests is None else tests
+    max_chars = None if full else config.PDF_PREVIEW_CHARS
+    text, match = analyze_document(doc, catalog, max_chars=max_chars, filename=filename)
+    rows, total_material, total_services = pricing_agent_build(recommendation_table(match, catalog), tests)
+    return text, match, rows, total_material, total_services
+
+def process_tender(tender, catalog=None, tests=None, full=False):
+    '''
+    Download, extract, match and price one tender (a dict as returned by
+    query_tenders). Returns a result dict for save_analysis; never raises,
+    failures are reported in its "status" and "error".
+    '''
+    result = {
+        "tender_key": tender_key(tender),
+        "title": tender.get("Tender Title", ""),
+        "doc_link": document_url(tender),
+        "doc_sha": None, "status": "ok", "error": None,
+        "relevance": None, "best_product": None, "material_total": None, "services_total": None,
+        "skipped_pages": [],
+    }
+    if not result["doc_link"]:
+        result["status"] = "no_document"
+        return result
+    try:
+        with span("pipeline_tender") as timing:
+            path = download_rfp(result["doc_link"])
+            if not path:
+                result["status"] = timing["status"] = "download_failed"
+                timing["ok"] = False
+                return result
+            result["doc_sha"] = document_sha(path)
+            text, match, _, material, services = analyze_and_price(path, catalog, tests, full, filename=path)
+            index_document_text(result["tender_key"], text)
+            record_document_fit(result["tender_key"], result["doc_sha"], match, catalog)
+            result.update(relevance=match["relevance_percent"], best_product=match["most_relevant"],
+                          material_total=material, services_total=services, skipped_pages=match["skipped_pages"])
+    except Exception as e:
+        log_error("pipeline", e, url=result["doc_link"])
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    return result
+
+def run_batch(tenders, workers=None, catalog=None, tests=None, full=False):
+    '''
+    Process `tenders` on a pool of `workers` processes (BATCH_WORKERS),
+    saving each result to the store as soon as it is ready. Returns the
+    results in completion order.
+    '''
+    workers = workers or config.BATCH_WORKERS
+    results = []
+    if workers <= 1 or len(tenders) <= 1:
+        for t in tenders:
+            results.append(process_tender(t, catalog, tests, full))
+            save_analysis(results[-1:])
+        return results
+    with process_pool(workers) as pool:
+        futures = [pool.submit(process_tender, t, catalog, tests, full) for t in tenders]
+        for fut in as_completed(futures):
+            results.append(fut.result())
+            save_analysis(results[-1:])
+    return results
+
+def run_pipeline(scrape=True, incremental=True, top=None, min_fit=None, order_by="score",
+                 workers=None, tests=None, full=False, time_budget=None):
+    '''
+    Optionally scrape, then analyse and price the `top` (BATCH_TOP_TENDERS)
+    best-ranked active tenders that link a document. Returns a summary dict
+    with the number of new tenders scraped and the per-tender results.
+    '''
+    summary = {"scraped": None, "results": []}
+    with span("pipeline", incremental=incremental, scrape=scrape):
+        if scrape:
+            from .scrape import PortalsUnreachable, scrape_tenders
+            try:
+                summary["scraped"] = len(scrape_tenders(time_budget=time_budget or config.SCRAPE_TIME_BUDGET,
+                                                        incremental=incremental))
+            except PortalsUnreachable as e:
+                # the stored tenders are still worth analysing
+                log_error("scrape", e)
+                summary["scraped"] = 0
+                summary["scrape_error"] = str(e)
+        else:
+            refresh_product_fit()
+        df = merge_near_duplicates(query_tenders(min_fit=min_fit, order_by=order_by))
+        tenders = [t for t in df.to_dict("records") if document_url(t)][:top or config.BATCH_TOP_TENDERS]
+        summary["results"] = run_batch(tenders, workers, tests=tests, full=full)
+    statuses = [r["status"] for r in summary["results"]]
+    log_event("pipeline", scraped=summary["scraped"], tenders=len(statuses), analysed=statuses.count("ok"))
+    return summary
@@ -0,0 +1,234 @@
+'''
+Pricing agent: unit prices from a price table (PRICE_TABLE_FILE, or the
+demo prices below) looked up by exact SKU, then by product line, priced
+column-wise over whole offers and bills of quantities. Prices stay
+numeric; format_inr / price_styler / the exporters format them for
+display and download only.
+'''
+import csv
+import os
+import re
+import threading
+
+from . import config
+from .matching import product_sku
+
+DUMMY_PRODUCT_PRICES = {
+    # some dummy per-unit prices (INR)
+    "Interior Emulsion Paint – White, 20L": 4200,
+    "Interior Emulsion Paint – Light Green, 20L": 4000,
+    "Waterproof Primer – 5L": 1800,
+    "De-Rusting Primer, 5L": 2200
+}
+
+DUMMY_TEST_PRICES = {
+    "VOC Test": 2000,
+    "Scrub Resistance Test": 3000,
+    "Adhesion Test": 1500,
+    "Visual Inspection (site)": 1000
+}
+
+PRICE_COLUMNS = ("Unit Price (INR)", "Tests Price (INR)", "Total (INR)", "Amount (INR)")
+
+# ----------------------------
+# Price table and its indexes
+# ----------------------------
+_price_index = {"lock": threading.Lock(), "key": None, "index": None}
+
+def normalize_product(name):
+    '''Product line of a name, as keyed in the prefix index: text before the first "–" or ",", lower-cased.'''
+    return " ".join(re.split(r"–|,|\s-\s", str(name), maxsplit=1)[0].lower().split())
+
+def demo_price_table():
+    '''(sku, product, unit_price) rows of the demo prices; SKUs follow the demo catalog's order.'''
+    return [(product_sku(i), product, price) for i, (product, price) in enumerate(DUMMY_PRODUCT_PRICES.items())]
+
+def load_price_table(path=None):
+    '''
+    Rows (sku, product, unit_price) of a CSV price table with those column
+    headers, or of the demo prices when `path` (PRICE_TABLE_FILE) does not
+    exist. Rows without a usable price are skipped.
+    '''
+    path = path or config.PRICE_TABLE_FILE
+    if not os.path.exists(path):
+        return demo_price_table()
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            try:
+                price = float(str(r.get("unit_price", "")).replace(",", ""))
+            except ValueError:
+                continue
+            rows.append(((r.get("sku") or "").strip(), (r.get("product") or "").strip(), price))
+    return rows
+
+def build_price_index(rows):
+    '''
+    Exact SKU index and normalized product-line index over price table
+    rows. The first row of a product line sets its price, as in the table.
+    '''
+    index = {"sku": {}, "prefix": {}}
+    for sku, product, price in rows:
+        if sku:
+            index["sku"].setdefault(sku, price)
+        if product:
+            index["prefix"].setdefault(normalize_product(product), price)
+    return index
+
+def get_price_index():
+    '''Price index of PRICE_TABLE_FILE, rebuilt only when the file changes.'''
+    path = config.PRICE_TABLE_FILE
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        key = (path, None)
+    with _price_index["lock"]:
+        if _price_index["key"] != key:
+            _price_index["index"] = build_price_index(load_price_table(path))
+            _price_index["key"] = key
+        return _price_index["index"]
+
+def prefix_price(name, index):
+    '''Price of the longest indexed product line that `name` starts with (word-wise), or None.'''
+    words = normalize_product(name).split()
+    prefixes = index["prefix"]
+    for n in range(len(words), 0, -1):
+        price = prefixes.get(" ".join(words[:n]))
+        if price is not None:
+            return price
+    return None
+
+def unit_prices(skus, products, index=None):
+    '''
+    Unit price per row (a float Series, NaN where unknown): exact SKU
+    first, then the product-line prefix of `products`, each distinct name
+    being looked up once.
+    '''
+    index = index or get_price_index()
+    prices = skus.map(index["sku"]).astype(float)
+    missing = prices.isna() & products.notna()
+    if missing.any():
+        names = products[missing]
+        by_name = {name: prefix_price(name, index) for name in names.unique()}
+        prices[missing] = names.map(by_name).astype(float)
+    return prices
+
+def tests_price(test_list):
+    '''Price of the selected tests/acceptance activities, priced once per offer.'''
+    return sum(DUMMY_TEST_PRICES.get(t, 1000) for t in test_list)
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+# ----------------------------
+# Offers
+# ----------------------------
+def pricing_agent_build(pr_table, test_list, base_price_override=None):
+    '''
+    pr_table: list of dicts with keys: Product, Recommended SKU, Match (%)
+    test_list: list of strings
+    Returns (DataFrame with numeric price columns, total_material,
+    total_services). Every row is an alternative offer carrying the tests;
+    products missing from the price table cost `base_price_override`
+    (10000 when not given).
+    '''
+    import pandas as pd
+    df = pd.DataFrame(list(pr_table), columns=["Product", "Recommended SKU", "Match (%)"])
+    services_price = tests_price(test_list)
+    df["Unit Price (INR)"] = unit_prices(df["Recommended SKU"], df["Product"]).fillna(base_price_override or 10000)
+    df["Tests Included"] = ", ".join(test_list)
+    df["Tests Price (INR)"] = services_price
+    df["Total (INR)"] = df["Unit Price (INR)"] + services_price
+    return df, _number(df["Unit Price (INR)"].sum()), _number(services_price * len(df))
+
+def price_line_items(items, test_list, min_match=0.0):
+    '''
+    Price a bill of quantities (line items as from extract_boq, a list or
+    DataFrame): unit price x quantity (1 when not given) for every item
+    matched to a product at least `min_match` %; other items and products
+    missing from the price table stay unpriced (NaN). Tests are priced
+    once for the whole offer. Returns (DataFrame, total_material,
+    total_services).
+    '''
+    import pandas as pd
+    df = pd.DataFrame(items).copy()
+    for col in ("Quantity", "Best Product", "Recommended SKU", "Match (%)"):
+        if col not in df:
+            df[col] = None
+    match = pd.to_numeric(df["Match (%)"], errors="coerce").fillna(0)
+    priced = (match > 0) & (match >= min_match)
+    unit = unit_prices(df["Recommended SKU"], df["Best Product"])
+    df["Unit Price (INR)"] = unit.where(priced)
+    df["Amount (INR)"] = df["Unit Price (INR)"] * pd.to_numeric(df["Quantity"], errors="coerce").fillna(1)
+    return df, _number(df["Amount (INR)"].sum()), _number(tests_price(test_list))
+
+def recommendation_table(match, catalog=None):
+    '''Pricing-agent input rows (product line, SKU, match %) for a check_relevance result.'''
+    catalog = config.product_db if catalog is None else catalog
+    position = {product: i for i, product in enumerate(catalog)}
+    rec_table = []
+    for prod, pct in match['top_3']:
+        rec_table.append({
+            "Product": prod.split('–')[0].strip() if '–' in prod else prod,
+            "Recommended SKU": product_sku(position[prod]) if prod in position else None,
+            "Match (%)": pct
+        })
+    return rec_table
+
+# ----------------------------
+# Display and export
+# ----------------------------
+def format_inr(value):
+    '''"₹4,200" (paise shown only when there are any); "" for a missing price.'''
+    if _missing(value):
+        return ""
+    value = _number(value)
+    return f"₹{value:,}" if isinstance(value, int) else f"₹{value:,.2f}"
+
+def price_styler(df):
+    '''A pandas Styler showing the price columns of `df` as rupees, for st.table / st.dataframe.'''
+    return df.style.format(format_inr, subset=[c for c in PRICE_COLUMNS if c in df.columns])
+
+def write_prices_csv(df, out, chunk_rows=config.EXPORT_CHUNK_ROWS):
+    '''Stream `df` as CSV (numbers unformatted) to the text file object `out`, `chunk_rows` rows at a time.'''
+    for start in range(0, max(len(df), 1), chunk_rows):
+        df.iloc[start:start + chunk_rows].to_csv(out, index=False, header=start == 0)
+
+def write_prices_xlsx(df, out, chunk_rows=config.EXPORT_CHUNK_ROWS):
+    '''
+    Write `df` to an .xlsx file (path or binary file object) with openpyxl's
+    write-only mode, so rows are streamed rather than held as cells. Price
+    columns keep numeric values with a rupee number format.
+    '''
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Prices")
+    columns = list(df.columns)
+    ws.append(columns)
+    money = {i for i, c in enumerate(columns) if c in PRICE_COLUMNS}
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        # plain Python values, missing ones as None; only price cells need a styled cell
+        for row in chunk.astype(object).where(chunk.notna(), None).values.tolist():
+            for i in money:
+                if row[i] is not None:
+                    row[i] = WriteOnlyCell(ws, value=row[i])
+                    row[i].number_format = "₹#,##0.00"
+            ws.append(row)
+    wb.save(out)
+
+def export_prices(df, fmt="csv"):
+    '''Bytes of `df` exported as "csv" or "xlsx", e.g. for a download button.'''
+    from io import BytesIO, StringIO
+    if fmt == "xlsx":
+        buf = BytesIO()
+        write_prices_xlsx(df, buf)
+        return buf.getvalue()
+    buf = StringIO()
+    write_prices_csv(df, buf)
+    return buf.getvalue().encode("utf-8")
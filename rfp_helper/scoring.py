@@ -0,0 +1,252 @@
+'''Tender scoring, exact deduplication and cross-portal near-duplicate merging.'''
+import json
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from . import config
+from .dates import parse_deadlines
+from .store import store_connect
+from .util import atomic_write
+
+# ----------------------------
+# Tender scoring
+# ----------------------------
+SCORE_WEIGHTS = {
+    "deadline": 1.0,   # per day closer than 90 days to the deadline
+    "keyword": 20.0,   # title mentions one of our product lines
+    "value": 0.0,      # per lakh (1e5 INR) of "Estimated Value", when portals provide it
+}
+SCORE_KEYWORDS_RE = re.compile(r"(?:wire|cable|electrical|primer|paint|emulsion)", re.I)
+DEDUP_KEY = ("Tender Number", "Tender Title")   # title compared on its first 80 chars
+
+def load_score_weights():
+    '''SCORE_WEIGHTS with any overrides saved in SCORE_WEIGHTS_FILE.'''
+    weights = dict(SCORE_WEIGHTS)
+    try:
+        with open(config.SCORE_WEIGHTS_FILE, "r") as f:
+            weights.update({k: float(v) for k, v in json.load(f).items() if k in weights})
+    except Exception:
+        pass
+    return weights
+
+def save_score_weights(weights):
+    atomic_write(config.SCORE_WEIGHTS_FILE, json.dumps(weights), mode="w")
+
+def score_tenders(df, weights=None):
+    '''
+    Score a whole DataFrame of tenders at once; returns a float Series.
+    Uses the parsed "Deadline Date" column when present.
+    '''
+    w = weights or load_score_weights()
+    if df.empty:
+        return pd.Series(dtype="float64", index=df.index)
+    if "Deadline Date" in df.columns:
+        dates = pd.to_datetime(df["Deadline Date"], errors="coerce")
+    else:
+        dates = parse_deadlines(df.get("Deadline", pd.Series("", index=df.index)))
+    days_left = (dates - pd.Timestamp.now()).dt.days
+    # closer deadlines reduce score; we prefer more time to respond
+    score = w["deadline"] * (90 - days_left).clip(lower=0).fillna(0)
+    # keyword boost for wires/cables/paints/primer
+    titles = df["Tender Title"].fillna("").astype(str) if "Tender Title" in df.columns else pd.Series("", index=df.index)
+    score += w["keyword"] * titles.str.contains(SCORE_KEYWORDS_RE).astype(float)
+    if w.get("value") and "Estimated Value" in df.columns:
+        score += w["value"] * pd.to_numeric(df["Estimated Value"], errors="coerce").fillna(0) / 1e5
+    return score.astype("float64").round(2)
+
+def compute_tender_score(meta, deadline=None):
+    '''Score one tender; pass `deadline` when it is already parsed.'''
+    row = dict(meta)
+    if deadline is not None:
+        row["Deadline Date"] = deadline
+    try:
+        return float(score_tenders(pd.DataFrame([row])).iloc[0])
+    except Exception:
+        return 0
+
+def dedup_tenders(df):
+    '''Keep the highest-scored row per (Tender Number, Title[:80]) key: a keyed group-by-max.'''
+    if df.empty:
+        return df
+    keys = pd.DataFrame({
+        "number": df["Tender Number"].fillna("").astype(str).str.strip(),
+        "title": df["Tender Title"].fillna("").astype(str).str[:80].str.strip(),
+    }, index=df.index)
+    best = df["Score"].fillna(0).groupby([keys["number"], keys["title"]], sort=False).idxmax()
+    return df.loc[best.values].reset_index(drop=True)
+
+# ----------------------------
+# Near-duplicate detection (MinHash + LSH)
+# ----------------------------
+NEAR_DUP_THRESHOLD = 0.8      # Jaccard similarity of titles above which two tenders may be merged
+MINHASH_PERMUTATIONS = 64
+SHINGLE_SIZE = 5              # characters per shingle
+_MERSENNE = np.uint64((1 << 61) - 1)
+_perm_rng = np.random.RandomState(1)
+# a, b span the whole field: a small `a` would keep a*h + b monotone in h and
+# make every permutation pick the same minimum (uint64 overflow wraps, as intended)
+_PERM_A = _perm_rng.randint(1, (1 << 61) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _perm_rng.randint(0, (1 << 61) - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+_DIGITS_RE = re.compile(r"\d+")
+
+def _shingle_hashes(text):
+    text = _NORMALIZE_RE.sub(" ", str(text or "").lower().replace("&", " and ")).strip()
+    if len(text) <= SHINGLE_SIZE:
+        grams = {text}
+    else:
+        grams = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+def minhash_signatures(texts):
+    '''(n, MINHASH_PERMUTATIONS) MinHash signatures of the texts' character shingles.'''
+    sigs = np.empty((len(texts), MINHASH_PERMUTATIONS), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        h = _shingle_hashes(text)
+        sigs[i] = ((np.outer(h, _PERM_A) + _PERM_B) % _MERSENNE).min(axis=0)
+    return sigs
+
+def _lsh_bands(threshold):
+    '''(bands, rows) splitting the signature so the LSH S-curve crosses near `threshold`.'''
+    options = [(b, MINHASH_PERMUTATIONS // b) for b in range(1, MINHASH_PERMUTATIONS + 1)
+               if MINHASH_PERMUTATIONS % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+def near_duplicate_groups(texts, threshold=NEAR_DUP_THRESHOLD, guard=None):
+    '''
+    Group indices of near-duplicate texts. Candidate pairs come from LSH
+    buckets (so the cost grows with the number of collisions, not n^2) and
+    are confirmed by the exact Jaccard similarity of their shingles >=
+    threshold and, when given, `guard(i, j)`. Returns a list of index
+    lists, singletons included.
+    '''
+    n = len(texts)
+    parent = list(range(n))
+    shingles = {}
+
+    def jaccard(i, j):
+        for k in (i, j):
+            if k not in shingles:
+                shingles[k] = set(_shingle_hashes(texts[k]).tolist())
+        return len(shingles[i] & shingles[j]) / len(shingles[i] | shingles[j])
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if n > 1:
+        sigs = minhash_signatures(texts)
+        bands, rows = _lsh_bands(threshold)
+        checked = set()
+        for b in range(bands):
+            buckets = {}
+            for i, band in enumerate(sigs[:, b * rows:(b + 1) * rows]):
+                buckets.setdefault(band.tobytes(), []).append(i)
+            for members in buckets.values():
+                for j in members[1:]:
+                    i = members[0]
+                    if (i, j) in checked or find(i) == find(j):
+                        continue
+                    checked.add((i, j))
+                    if jaccard(i, j) >= threshold and (guard is None or guard(i, j)):
+                        parent[find(j)] = find(i)
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+def _digit_groups(text):
+    '''Numbers in `text`, leading zeros dropped: "2026_HEAL_000134_1" -> {2026, 134, 1}.'''
+    return frozenset(int(g) for g in _DIGITS_RE.findall(str(text or "")))
+
+def _unmatched_words(words, other):
+    '''Words with no counterpart in `other` (the same word, or one a prefix of the other: "paint"/"paints").'''
+    return [w for w in words - other if not any(w.startswith(o) or o.startswith(w) for o in other)]
+
+def _place(text):
+    return _NORMALIZE_RE.sub(" ", str(text or "").lower()).strip()
+
+def merge_near_duplicates(df, threshold=NEAR_DUP_THRESHOLD):
+    '''
+    Collapse tenders listed on several portals under slightly different
+    titles or number formats into their best-scored record. Similar titles
+    are not enough: the numbers in both titles must be the same, neither
+    title may put a different word where the other has one ("at Lucknow" /
+    "at Kanpur"), and at least one more field must agree, either the numbers of the tender
+    number (one portal may drop a suffix) or the buyer or location (one
+    containing the other). Different tender numbers, locations or parsed
+    deadlines keep tenders apart. Merged records keep every source and
+    document link in "Sources" / "Doc Links" and the number of listings in
+    "Listings". Rows keep the order of `df` (each merged record takes the
+    place of its first listing), so its ranking is left as it was.
+    '''
+    if df.empty:
+        return df
+    df = df.reset_index(drop=True)
+    texts = df["Tender Title"].fillna("").astype(str).tolist()
+    title_numbers = [_digit_groups(t) for t in texts]
+    title_words = [frozenset(_NORMALIZE_RE.sub(" ", t.lower()).split()) for t in texts]
+    numbers = [_digit_groups(n) for n in df["Tender Number"].fillna("")] if "Tender Number" in df.columns else [frozenset()] * len(df)
+    buyers = [_place(b) for b in df["Buyer"].fillna("")] if "Buyer" in df.columns else [""] * len(df)
+    locations = [_place(loc) for loc in df["Location"].fillna("")] if "Location" in df.columns else [""] * len(df)
+    dates = pd.to_datetime(df["Deadline Date"], errors="coerce") if "Deadline Date" in df.columns \
+        else parse_deadlines(df["Deadline"])
+
+    def same_tender(i, j):
+        if not (pd.isna(dates[i]) or pd.isna(dates[j]) or dates[i] == dates[j]):
+            return False
+        if title_numbers[i] != title_numbers[j]:
+            return False
+        if _unmatched_words(title_words[i], title_words[j]) and _unmatched_words(title_words[j], title_words[i]):
+            return False
+        agreed = False
+        if numbers[i] and numbers[j]:
+            if not (numbers[i] <= numbers[j] or numbers[j] <= numbers[i]):
+                return False
+            agreed = True
+        if locations[i] and locations[j]:
+            if locations[i] not in locations[j] and locations[j] not in locations[i]:
+                return False
+            agreed = True
+        if buyers[i] and buyers[j] and (buyers[i] in buyers[j] or buyers[j] in buyers[i]):
+            agreed = True
+        return agreed
+
+    groups = near_duplicate_groups(texts, threshold, guard=same_tender)
+    scores = df["Score"].fillna(0).to_numpy() if "Score" in df.columns else np.zeros(len(df))
+    keep, sources, links, listings = [], [], [], []
+    for members in sorted(groups, key=min):
+        best = max(members, key=lambda i: scores[i])
+        keep.append(best)
+        sources.append(" | ".join(dict.fromkeys(str(df.at[i, "Source"]) for i in members if df.at[i, "Source"])))
+        links.append(" | ".join(dict.fromkeys(str(df.at[i, "Doc Link"]) for i in members if df.at[i, "Doc Link"])))
+        listings.append(len(members))
+    out = df.loc[keep].copy()
+    out["Sources"] = sources
+    out["Doc Links"] = links
+    out["Listings"] = listings
+    # a merged tender may only have a document on one of its portals
+    out["Doc Link"] = [dl or (al.split(" | ")[0] if al else "") for dl, al in zip(out["Doc Link"], links)]
+    return out.reset_index(drop=True)
+
+def rescore_store(weights=None):
+    '''Recompute the score of every stored tender (e.g. after a weight change). Returns the row count.'''
+    conn = store_connect()
+    try:
+        df = pd.read_sql_query(
+            'SELECT id, title AS "Tender Title", deadline_date AS "Deadline Date" FROM tenders', conn
+        )
+        if df.empty:
+            return 0
+        scores = score_tenders(df, weights)
+        with conn:
+            conn.executemany("UPDATE tenders SET score = ? WHERE id = ?",
+                             zip(scores.tolist(), df["id"].tolist()))
+        return len(df)
+    finally:
+        conn.close()
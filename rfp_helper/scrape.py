@@ -0,0 +1,230 @@
+'''
+Scraping: crawl the TENDER_SOURCES listings in parallel, score the new
+tenders and upsert them into the store.
+'''
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from . import config
+from .dates import due_within, parse_deadlines
+from .fetch import safe_get
+from .listing import extract_rows, find_page_links, iter_listing_rows
+from .matching import refresh_product_fit
+from .metrics import count, export_prometheus, log_error, log_event, record_span, span
+from .scoring import dedup_tenders, load_score_weights, score_tenders
+from .store import (load_watermark, set_store_meta, tender_key, update_watermark, upsert_tenders,
+                    watermark_cut_short)
+
+class PortalsUnreachable(Exception):
+    '''No listing page of any portal could be fetched; the store was left as it was.'''
+
+# ----------------------------
+# Scraping main
+# ----------------------------
+def scrape_page(portal, url, limit, known=frozenset(), revalidate=False, stop_at_known=True):
+    '''
+    Fetch and parse one listing page of `portal` (runs on a worker thread).
+    Returns a dict with the new, scored `tenders`, the keys of the rows read
+    that later scrapes may skip (`seen_keys`, for the watermark: rows without
+    a deadline in the 3-month window, or past `limit`, are left out, so they
+    are checked again later), the pagination `links` found and `stop`
+    when the portal need not be crawled further: either KNOWN_STOP_AFTER
+    known rows in a row were reached (incremental mode, with
+    `stop_at_known`), or every dated row
+    on the page falls outside the 3-month window. With `revalidate` the
+    page is requested even if a cached copy is still within its TTL.
+    '''
+    page = {"tenders": [], "seen_keys": [], "links": [], "stop": False}
+    stats = page["stats"] = {"rows_seen": 0, "rows_parsed": 0, "bytes": 0, "cached": False, "failed": False}
+    with span("fetch", portal) as fetch:
+        resp = safe_get(url, revalidate=revalidate)
+        fetch["ok"] = resp is not None
+        stats["failed"] = resp is None
+        if resp is not None:
+            stats["bytes"] = fetch["bytes"] = len(resp.content)
+            stats["cached"] = fetch["cached"] = getattr(resp, "from_cache", False)
+    if not resp or limit <= 0:
+        return page
+    known_run = dated = in_window = 0
+    batch, order, settled = [], [], set()
+    weights = load_score_weights()
+    started, flush_seconds = time.perf_counter(), 0.0
+
+    def flush():
+        '''Parse, filter and score the batched rows; True once `limit` is reached.'''
+        nonlocal dated, in_window, flush_seconds
+        flush_start = time.perf_counter()
+        df = pd.DataFrame(batch)
+        df["Deadline Date"] = parse_deadlines(df["Deadline"], portal)
+        parsed = int(df["Deadline Date"].notna().sum())
+        if parsed < len(df):
+            count("dates_unparsed", len(df) - parsed, portal=portal)
+        dated += parsed
+        df = df[due_within(df["Deadline Date"])]
+        in_window += len(df)
+        df = df.assign(Score=score_tenders(df, weights)).head(limit - len(page["tenders"]))
+        # rows cut off by the limit stay out of the watermark, like out-of-window ones
+        settled.update(tender_key({"Tender Number": n, "Tender Title": t})
+                       for n, t in zip(df["Tender Number"], df["Tender Title"]))
+        page["tenders"].extend(df.to_dict("records"))
+        batch.clear()
+        flush_seconds += time.perf_counter() - flush_start
+        return len(page["tenders"]) >= limit
+
+    try:
+        for meta in extract_rows(iter_listing_rows(resp.content), portal):
+            stats["rows_seen"] += 1
+            if not meta:
+                continue
+            stats["rows_parsed"] += 1
+            key = tender_key(meta)
+            order.append(key)
+            if key in known:
+                settled.add(key)
+                known_run += 1
+                if stop_at_known and known_run >= config.KNOWN_STOP_AFTER:
+                    page["stop"] = True
+                    break
+                continue
+            known_run = 0
+            if meta.get("Deadline"):
+                batch.append(meta)
+                if len(batch) >= config.DATE_BATCH_ROWS and flush():
+                    return page
+        if batch and flush():
+            return page
+        if page["stop"]:
+            return page
+        page["stop"] = dated > 0 and in_window == 0
+        page["links"] = find_page_links(resp.content, url)
+        return page
+    finally:
+        page["seen_keys"] = [k for k in order if k in settled]
+        _record_page_stats(portal, page, time.perf_counter() - started - flush_seconds, flush_seconds)
+
+def _record_page_stats(portal, page, extract_seconds, dates_seconds):
+    stats = page["stats"]
+    record_span("extract", extract_seconds, portal, rows=stats["rows_seen"])
+    record_span("dates_score", dates_seconds, portal, rows=stats["rows_parsed"])
+    count("rows_seen", stats["rows_seen"], portal=portal)
+    count("rows_parsed", stats["rows_parsed"], portal=portal)
+    count("rows_kept", len(page["tenders"]), portal=portal)
+
+def _trim_page(page, room):
+    '''
+    Keep at most `room` of a page's tenders: pages in flight together each
+    got the portal's whole remaining limit. Dropped tenders stay out of
+    the watermark, so a later scrape still finds them.
+    '''
+    room = max(room, 0)
+    if len(page["tenders"]) <= room:
+        return
+    kept, dropped = page["tenders"][:room], page["tenders"][room:]
+    dropped_keys = {tender_key(t) for t in dropped} - {tender_key(t) for t in kept}
+    page["tenders"] = kept
+    page["seen_keys"] = [k for k in page["seen_keys"] if k not in dropped_keys]
+
+def scrape_tenders(limit_per_portal=config.MAX_ROWS_PER_PORTAL, time_budget=config.SCRAPE_TIME_BUDGET, incremental=True):
+    '''
+    Crawl all TENDER_SOURCES in parallel, following pagination links through
+    a bounded per-portal frontier (MAX_PAGES_PER_PORTAL, `limit_per_portal`
+    rows, PORTAL_TIME_BUDGET, PAGES_IN_FLIGHT pages at a time). Each page is
+    collected as soon as it finishes; pages still running
+    when `time_budget` expires are abandoned. With `incremental`, only
+    tenders not seen by a previous scrape are returned (and upserted), and
+    a portal whose last crawl stopped at `limit_per_portal` is read past its
+    known rows so the tenders left over are still found; otherwise (a full or forced refresh) every page is requested again
+    rather than served from the HTTP cache.
+    Per-portal totals are logged as a "run" event for the Diagnostics page.
+    Raises PortalsUnreachable when not a single page could be fetched, so
+    the store's "last_refresh" keeps telling the real age of the data.
+    '''
+    found = []
+    started = time.monotonic()
+    portals = {
+        p: {"queue": deque([p]), "visited": {p}, "pages": 0, "rows": 0, "inflight": 0,
+            "done": False, "seen": {}, "known": frozenset(load_watermark(p)) if incremental else frozenset(),
+            "stop_at_known": not watermark_cut_short(p),
+            "summary": dict.fromkeys(("pages", "rows_seen", "rows_parsed", "rows_kept", "bytes", "cached", "failed"), 0)}
+        for p in config.TENDER_SOURCES
+    }
+    pool = ThreadPoolExecutor(max_workers=max(1, min(config.FETCH_WORKERS, len(config.TENDER_SOURCES) * config.PAGES_IN_FLIGHT)))
+    pending = {}
+
+    def schedule(portal):
+        state = portals[portal]
+        while (not state["done"] and state["queue"] and state["inflight"] < config.PAGES_IN_FLIGHT
+               and state["pages"] < config.MAX_PAGES_PER_PORTAL
+               and time.monotonic() - started < config.PORTAL_TIME_BUDGET):
+            url = state["queue"].popleft()
+            fut = pool.submit(scrape_page, portal, url, limit_per_portal - state["rows"], state["known"],
+                              not incremental, state["stop_at_known"])
+            pending[fut] = (portal, state["pages"])
+            state["pages"] += 1
+            state["inflight"] += 1
+
+    try:
+        for portal in portals:
+            schedule(portal)
+        while pending:
+            remaining = time_budget - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                portal, page_no = pending.pop(fut)
+                state = portals[portal]
+                state["inflight"] -= 1
+                summary = state["summary"]
+                summary["pages"] += 1
+                try:
+                    page = fut.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    log_error("scrape_page", e, portal=portal)
+                    continue
+                for k in ("rows_seen", "rows_parsed", "bytes", "cached", "failed"):
+                    summary[k] += int(page["stats"][k])
+                _trim_page(page, limit_per_portal - state["rows"])
+                summary["rows_kept"] += len(page["tenders"])
+                found.extend(page["tenders"])
+                state["seen"][page_no] = page["seen_keys"]
+                state["rows"] += len(page["tenders"])
+                if page["stop"] or state["rows"] >= limit_per_portal:
+                    state["done"] = True
+                for link in page["links"]:
+                    if link not in state["visited"]:
+                        state["visited"].add(link)
+                        state["queue"].append(link)
+                schedule(portal)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    for portal, state in portals.items():
+        if state["summary"]["pages"] == state["summary"]["failed"]:
+            continue  # nothing read; keep the watermark as it was
+        try:
+            update_watermark(portal, [k for n in sorted(state["seen"]) for k in state["seen"][n]],
+                             cut_short=state["rows"] >= limit_per_portal)
+        except Exception as e:
+            log_error("watermark", e, portal=portal)
+            continue
+    with span("store", rows=len(found)):
+        # Enrich and deduplicate by Tender Number + Title
+        result = dedup_tenders(pd.DataFrame(found)).to_dict("records") if found else []
+        # Persist to the tender store
+        upsert_tenders(result)
+        refresh_product_fit()
+    fetched = sum(state["summary"]["pages"] - state["summary"]["failed"] for state in portals.values())
+    if fetched:
+        set_store_meta("last_refresh", time.time())
+    seconds = time.monotonic() - started
+    record_span("scrape", seconds, incremental=incremental)
+    log_event("run", seconds=round(seconds, 3), incremental=incremental, tenders=len(result),
+              abandoned=len(pending), portals={p: state["summary"] for p, state in portals.items()})
+    export_prometheus()
+    if not fetched:
+        raise PortalsUnreachable(f"none of the {len(portals)} tender portals could be reached")
+    return result
@@ -0,0 +1,192 @@
+'''
+Full-text tender search: a BM25 inverted index in the tender store over
+titles, buyers, locations and extracted document text. Tenders are
+indexed as they are stored and documents as they are analysed, one field
+at a time, so a refresh only re-indexes what changed. Results can be
+narrowed with facets (source, buyer, location).
+'''
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from . import config
+from .metrics import count, span
+from .store import query_tenders, store_connect, tender_key
+
+# Tender dict field -> indexed field
+SEARCH_FIELDS = {"Tender Title": "title", "Buyer": "buyer", "Location": "location"}
+FACET_FIELDS = ("Source", "Buyer", "Location")
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or the to with".split()
+)
+
+_backfilled = set()           # stores whose pre-index tenders have been indexed
+_backfill_lock = threading.Lock()
+
+def tokenize(text):
+    '''Lower-cased words and numbers of `text`, without stop words and single letters.'''
+    return [t for t in TOKEN_RE.findall(str(text or "").lower()) if len(t) > 1 and t not in STOP_WORDS]
+
+# ----------------------------
+# Indexing
+# ----------------------------
+def _doc_id(conn, key):
+    '''Integer id of a tender in the index (postings carry it rather than the long tender key).'''
+    conn.execute("INSERT INTO search_docs (tender_key) VALUES (?) ON CONFLICT (tender_key) DO NOTHING", (key,))
+    return conn.execute("SELECT id FROM search_docs WHERE tender_key = ?", (key,)).fetchone()[0]
+
+def _index_field(conn, key, field, text):
+    '''(Re-)index one field of a tender unless its text is unchanged. Returns True if it was.'''
+    text = str(text or "")
+    sha = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    doc = _doc_id(conn, key)
+    row = conn.execute("SELECT sha FROM search_fields WHERE doc = ? AND field = ?", (doc, field)).fetchone()
+    if row is not None and row["sha"] == sha:
+        return False
+    terms = Counter(tokenize(text))
+    conn.execute("DELETE FROM search_postings WHERE doc = ? AND field = ?", (doc, field))
+    # in key order, so the postings B-tree is filled sequentially
+    conn.executemany("INSERT INTO search_postings (term, doc, field, tf) VALUES (?, ?, ?, ?)",
+                     [(term, doc, field, terms[term]) for term in sorted(terms)])
+    conn.execute("INSERT OR REPLACE INTO search_fields (doc, field, length, sha) VALUES (?, ?, ?, ?)",
+                 (doc, field, sum(terms.values()), sha))
+    return True
+
+def index_tenders(conn, tenders):
+    '''
+    Index the title, buyer and location of `tenders` (dicts) on `conn`,
+    inside the caller's transaction. Returns the number of fields that
+    changed.
+    '''
+    changed = 0
+    for t in tenders:
+        key = tender_key(t)
+        for name, field in SEARCH_FIELDS.items():
+            changed += _index_field(conn, key, field, t.get(name))
+    count("search_index", changed, kind="tender")
+    return changed
+
+def index_document_text(key, text):
+    '''Index the extracted document text of the tender with key `key` (its first SEARCH_TEXT_CHARS).'''
+    if not key:
+        return False
+    conn = store_connect()
+    try:
+        with conn:
+            changed = _index_field(conn, key, "text", (text or "")[:config.SEARCH_TEXT_CHARS])
+    finally:
+        conn.close()
+    count("search_index", int(changed), kind="text")
+    return changed
+
+def _backfill_index(conn):
+    '''Index tenders stored before the search index existed; once per store and process.'''
+    with _backfill_lock:
+        if config.TENDER_DB in _backfilled:
+            return
+        rows = conn.execute(
+            '''SELECT tender_number, title, buyer, location FROM tenders
+               WHERE tender_key NOT IN (SELECT d.tender_key FROM search_docs d
+                                        JOIN search_fields f ON f.doc = d.id AND f.field = 'title')'''
+        ).fetchall()
+        if rows:
+            with conn:
+                index_tenders(conn, [{"Tender Number": r["tender_number"], "Tender Title": r["title"],
+                                      "Buyer": r["buyer"], "Location": r["location"]} for r in rows])
+        _backfilled.add(config.TENDER_DB)
+
+# ----------------------------
+# Querying
+# ----------------------------
+def _in_chunks(conn, sql, ids):
+    '''Rows of `sql` (with one "{ids}" placeholder list) for all `ids`, 500 at a time.'''
+    ids = list(ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        yield from conn.execute(sql.format(ids=", ".join("?" * len(chunk))), chunk)
+
+def search_scores(query, limit=None):
+    '''
+    BM25 scores of the tenders matching any word of `query`, as a list of
+    (tender_key, score), best first, at most `limit` (all when None).
+    Fields count with their SEARCH_FIELD_WEIGHTS, so a word in a title
+    outweighs the same word in the document text.
+    '''
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    weights, k1, b = config.SEARCH_FIELD_WEIGHTS, config.SEARCH_BM25_K1, config.SEARCH_BM25_B
+    with span("search", terms=len(terms)) as timing:
+        conn = store_connect()
+        try:
+            _backfill_index(conn)
+            # weighted term frequency per (term, tender)
+            wtf = defaultdict(float)
+            for r in conn.execute(
+                f"SELECT term, doc, field, tf FROM search_postings WHERE term IN ({', '.join('?' * len(terms))})", terms
+            ):
+                wtf[r["term"], r["doc"]] += weights.get(r["field"], 1.0) * r["tf"]
+            if not wtf:
+                timing["hits"] = 0
+                return []
+            n_docs = conn.execute("SELECT COUNT(*) FROM search_docs").fetchone()[0]
+            total = sum(weights.get(r["field"], 1.0) * r["total"] for r in
+                        conn.execute("SELECT field, SUM(length) AS total FROM search_fields GROUP BY field"))
+            # weighted length of every matching tender
+            lengths = defaultdict(float)
+            for r in _in_chunks(conn, "SELECT doc, field, length FROM search_fields WHERE doc IN ({ids})",
+                                {doc for _, doc in wtf}):
+                lengths[r["doc"]] += weights.get(r["field"], 1.0) * r["length"]
+            avgdl = total / n_docs if n_docs and total else 1.0
+            doc_freq = Counter(term for term, _ in wtf)
+            scores = defaultdict(float)
+            for (term, doc), tf in wtf.items():
+                idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                scores[doc] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc] / avgdl))
+            ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            keys = {r["id"]: r["tender_key"] for r in
+                    _in_chunks(conn, "SELECT id, tender_key FROM search_docs WHERE id IN ({ids})", [d for d, _ in ranked])}
+        finally:
+            conn.close()
+        timing["hits"] = len(ranked)
+    return [(keys[doc], score) for doc, score in ranked]
+
+def search_tenders(query, due_within_days=90, source=None, min_fit=None, limit=None):
+    '''
+    The `limit` (SEARCH_MAX_RESULTS) active tenders most relevant to
+    `query`, as query_tenders returns them plus a "Relevance" column (BM25
+    score), best first. The other arguments filter as in query_tenders,
+    before the limit is applied.
+    '''
+    limit = limit or config.SEARCH_MAX_RESULTS
+    ranked = dict(search_scores(query))
+    df = query_tenders(due_within_days, source, min_fit=min_fit, keys=list(ranked), limit=max(len(ranked), 1))
+    df["Relevance"] = df["Tender Key"].map(ranked).round(3)
+    return df.sort_values("Relevance", ascending=False, kind="stable").head(limit).reset_index(drop=True)
+
+# ----------------------------
+# Facets
+# ----------------------------
+def facet_counts(df, fields=FACET_FIELDS, top=None):
+    '''{field: [(value, tenders), ...]} for each facet field of `df`, most frequent first, blanks left out.'''
+    top = top or config.FACET_VALUES_SHOWN
+    facets = {}
+    for field in fields:
+        if field not in df.columns:
+            continue
+        values = df[field].fillna("").astype(str).str.strip()
+        facets[field] = list(values[values != ""].value_counts().head(top).items())
+    return facets
+
+def apply_facets(df, selected):
+    '''Rows of `df` whose value of each facet field is one of the values `selected` for it (empty = any).'''
+    mask = None
+    for field, values in selected.items():
+        if values and field in df.columns:
+            hit = df[field].fillna("").astype(str).str.strip().isin(values)
+            mask = hit if mask is None else mask & hit
+    return df if mask is None else df[mask].reset_index(drop=True)
@@ -0,0 +1,414 @@
+'''
+Tender store (SQLite): tenders, downloaded documents, the analysis cache,
+the analysis job queue, the full-text search index, small key/value
+metadata and per-portal scrape watermarks.
+'''
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from . import config
+from .dates import parse_date_flex
+
+# Tender dict / DataFrame field -> tenders table column
+TENDER_COLUMNS = {
+    "Tender Title": "title",
+    "Tender Number": "tender_number",
+    "Buyer": "buyer",
+    "Deadline": "deadline",
+    "Deadline Date": "deadline_date",
+    "Doc Link": "doc_link",
+    "Location": "location",
+    "Source": "source",
+    "Score": "score",
+    "Product Fit": "product_fit",
+    "Best Product": "best_product",
+    "Tender Key": "tender_key",
+}
+
+# Columns added after the first release of the store: (table, column, type)
+STORE_MIGRATIONS = [
+    ("tenders", "product_fit", "REAL"),
+    ("tenders", "best_product", "TEXT"),
+    ("tenders", "fit_version", "TEXT"),
+    ("analysis_jobs", "line_items", "INTEGER NOT NULL DEFAULT 0"),
+    ("tenders", "tender_key", "TEXT"),
+    ("tenders", "fit_doc_sha", "TEXT"),
+    ("portal_watermarks", "cut_short", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tenders (
+    id INTEGER PRIMARY KEY,
+    tender_number TEXT NOT NULL,
+    title TEXT NOT NULL,
+    buyer TEXT,
+    deadline TEXT,
+    deadline_date TEXT,
+    doc_link TEXT,
+    location TEXT,
+    source TEXT,
+    score REAL DEFAULT 0,
+    first_seen TEXT,
+    last_seen TEXT,
+    UNIQUE (tender_number, title)
+);
+CREATE INDEX IF NOT EXISTS idx_tenders_deadline ON tenders (deadline_date);
+CREATE INDEX IF NOT EXISTS idx_tenders_source ON tenders (source);
+CREATE INDEX IF NOT EXISTS idx_tenders_score ON tenders (score DESC);
+CREATE TABLE IF NOT EXISTS documents (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    content_type TEXT,
+    fetched_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_sha ON documents (sha256);
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    doc_sha TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    version TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (doc_sha, kind, version)
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_lru ON analysis_cache (last_access);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS portal_watermarks (
+    portal TEXT PRIMARY KEY,
+    recent_keys TEXT NOT NULL,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS tender_analysis (
+    tender_key TEXT PRIMARY KEY,
+    doc_link TEXT,
+    doc_sha TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    relevance REAL,
+    best_product TEXT,
+    material_total REAL,
+    services_total REAL,
+    analysed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    job_key TEXT PRIMARY KEY,
+    doc_link TEXT NOT NULL,
+    full INTEGER NOT NULL DEFAULT 0,
+    catalog_version TEXT NOT NULL,
+    tender_key TEXT,
+    priority REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON analysis_jobs (status, priority DESC, submitted_at);
+CREATE TABLE IF NOT EXISTS search_docs (
+    id INTEGER PRIMARY KEY,
+    tender_key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS search_fields (
+    doc INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    sha TEXT NOT NULL,
+    PRIMARY KEY (doc, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_doc ON search_postings (doc, field);
+'''
+
+_store_ready = set()
+_store_lock = threading.Lock()
+
+def store_connect():
+    '''Open TENDER_DB, creating the schema (and importing CACHE_FILE) on first use.'''
+    conn = sqlite3.connect(config.TENDER_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    with _store_lock:
+        if config.TENDER_DB not in _store_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(STORE_SCHEMA)
+            _migrate_store(conn)
+            _import_legacy_cache(conn)
+            _store_ready.add(config.TENDER_DB)
+    return conn
+
+def _migrate_store(conn):
+    for table, column, col_type in STORE_MIGRATIONS:
+        existing = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tenders_fit ON tenders (product_fit DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tenders_fit_version ON tenders (fit_version)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tenders_key ON tenders (tender_key)")
+    # tenders stored before the key column existed
+    missing = conn.execute("SELECT id, tender_number, title FROM tenders WHERE tender_key IS NULL").fetchall()
+    conn.executemany("UPDATE tenders SET tender_key = ? WHERE id = ?",
+                     [(tender_key({"Tender Number": r["tender_number"], "Tender Title": r["title"]}), r["id"])
+                      for r in missing])
+    conn.commit()
+
+def _import_legacy_cache(conn):
+    if conn.execute("SELECT 1 FROM tenders LIMIT 1").fetchone():
+        return
+    try:
+        if not os.path.exists(config.CACHE_FILE) or os.path.getsize(config.CACHE_FILE) == 0:
+            return
+        with open(config.CACHE_FILE, "r") as f:
+            legacy = json.load(f)
+    except Exception:
+        return
+    _upsert(conn, legacy)
+
+def _tender_row(t, now):
+    import pandas as pd
+    # column-wise parsing leaves NaT (which is truthy) for deadlines it could not read
+    d = t.get("Deadline Date")
+    if d is None or pd.isna(d):
+        d = parse_date_flex(t.get("Deadline", ""))
+    if d is not None and pd.isna(d):
+        d = None
+    return (
+        str(t.get("Tender Number", "") or "").strip(),
+        str(t.get("Tender Title", "") or "").strip(),
+        t.get("Buyer", ""),
+        t.get("Deadline", ""),
+        d.strftime("%Y-%m-%d") if d else None,
+        t.get("Doc Link", ""),
+        t.get("Location", ""),
+        t.get("Source", ""),
+        t.get("Score", 0) or 0,
+        tender_key(t),
+        now,
+        now,
+    )
+
+def _upsert(conn, tenders):
+    from .search import index_tenders
+    now = datetime.now().isoformat(timespec="seconds")
+    with conn:
+        conn.executemany(
+            '''INSERT INTO tenders (tender_number, title, buyer, deadline, deadline_date, doc_link,
+                                   location, source, score, tender_key, first_seen, last_seen)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (tender_number, title) DO UPDATE SET
+                   buyer = excluded.buyer,
+                   deadline = excluded.deadline,
+                   deadline_date = excluded.deadline_date,
+                   doc_link = excluded.doc_link,
+                   location = excluded.location,
+                   source = excluded.source,
+                   score = excluded.score,
+                   tender_key = excluded.tender_key,
+                   last_seen = excluded.last_seen''',
+            [_tender_row(t, now) for t in tenders],
+        )
+        # only fields whose text changed are re-indexed
+        index_tenders(conn, tenders)
+
+def upsert_tenders(tenders):
+    '''Insert new tenders and refresh known ones, keyed on (Tender Number, Title), and index them for search.'''
+    if not tenders:
+        return
+    conn = store_connect()
+    try:
+        _upsert(conn, tenders)
+    finally:
+        conn.close()
+
+def store_has_tenders():
+    conn = store_connect()
+    try:
+        return conn.execute("SELECT 1 FROM tenders LIMIT 1").fetchone() is not None
+    finally:
+        conn.close()
+
+def set_store_meta(key, value):
+    conn = store_connect()
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", (key, str(value)))
+    finally:
+        conn.close()
+
+def get_store_meta(key, default=None):
+    conn = store_connect()
+    try:
+        row = conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+    return row["value"] if row else default
+
+def tender_key(t):
+    '''Stable identity of a tender: Tender Number + first 80 chars of the title.'''
+    return f"{str(t.get('Tender Number', '') or '').strip()}|{str(t.get('Tender Title', '') or '')[:80].strip()}"
+
+def load_watermark(portal):
+    '''Keys of the newest listing rows seen on `portal` by earlier scrapes, newest first.'''
+    conn = store_connect()
+    try:
+        row = conn.execute("SELECT recent_keys FROM portal_watermarks WHERE portal = ?", (portal,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row["recent_keys"]) if row else []
+
+def watermark_cut_short(portal):
+    '''True if the last crawl of `portal` stopped at its row limit, leaving older new rows unread.'''
+    conn = store_connect()
+    try:
+        row = conn.execute("SELECT cut_short FROM portal_watermarks WHERE portal = ?", (portal,)).fetchone()
+    finally:
+        conn.close()
+    return bool(row and row["cut_short"])
+
+def update_watermark(portal, seen_keys, cut_short=False):
+    '''
+    Put this crawl's keys in front of the stored ones, capped at
+    WATERMARK_SIZE, and remember whether the crawl was `cut_short`.
+    '''
+    merged = list(dict.fromkeys(list(seen_keys) + load_watermark(portal)))[:config.WATERMARK_SIZE]
+    conn = store_connect()
+    try:
+        with conn:
+            conn.execute(
+                '''INSERT INTO portal_watermarks (portal, recent_keys, updated_at, cut_short) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (portal) DO UPDATE SET recent_keys = excluded.recent_keys,
+                                                      updated_at = excluded.updated_at,
+                                                      cut_short = excluded.cut_short''',
+                (portal, json.dumps(merged), datetime.now().isoformat(timespec="seconds"), int(cut_short)),
+            )
+    finally:
+        conn.close()
+
+ANALYSIS_FIELDS = ("tender_key", "doc_link", "doc_sha", "status", "error", "relevance", "best_product",
+                   "material_total", "services_total")
+
+def save_analysis(results):
+    '''Upsert pipeline results (dicts with ANALYSIS_FIELDS), one row per tender key.'''
+    if not results:
+        return
+    now = datetime.now().isoformat(timespec="seconds")
+    conn = store_connect()
+    try:
+        with conn:
+            conn.executemany(
+                f'''INSERT OR REPLACE INTO tender_analysis ({", ".join(ANALYSIS_FIELDS)}, analysed_at)
+                    VALUES ({", ".join("?" * (len(ANALYSIS_FIELDS) + 1))})''',
+                [tuple(r.get(f) for f in ANALYSIS_FIELDS) + (now,) for r in results],
+            )
+    finally:
+        conn.close()
+
+def load_analysis(keys=None):
+    '''Stored pipeline results by tender key, for `keys` or all tenders.'''
+    conn = store_connect()
+    try:
+        if keys is None:
+            rows = conn.execute("SELECT * FROM tender_analysis").fetchall()
+        else:
+            keys = list(keys)
+            rows = []
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows += conn.execute(
+                    f"SELECT * FROM tender_analysis WHERE tender_key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        return {r["tender_key"]: dict(r) for r in rows}
+    finally:
+        conn.close()
+
+def query_tenders(due_within_days=90, source=None, min_score=None, min_fit=None, order_by="score", limit=1000,
+                  keys=None):
+    '''
+    Return a DataFrame of tenders due in the next `due_within_days`, ranked
+    by `order_by` ("score" or "fit"), optionally only those whose tender
+    key is in `keys`. Only matching rows are read, via the
+    deadline/score/fit/key indexes.
+    '''
+    select = ", ".join(f'{col} AS "{field}"' for field, col in TENDER_COLUMNS.items())
+    where, params = [], []
+    if due_within_days is not None:
+        today = datetime.now().date()
+        where.append("deadline_date BETWEEN ? AND ?")
+        params += [today.isoformat(), (today + timedelta(days=due_within_days)).isoformat()]
+    if source:
+        where.append("source = ?")
+        params.append(source)
+    if min_score is not None:
+        where.append("score >= ?")
+        params.append(min_score)
+    if min_fit:
+        where.append("product_fit >= ?")
+        params.append(min_fit)
+    if keys is not None:
+        where.append("tender_key IN (SELECT key FROM temp.query_keys)")
+    sql = f"SELECT {select} FROM tenders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY product_fit DESC, score DESC" if order_by == "fit" else " ORDER BY score DESC, product_fit DESC"
+    sql += " LIMIT ?"
+    params.append(int(limit))
+    import pandas as pd
+    conn = store_connect()
+    try:
+        if keys is not None:
+            # any number of keys, joined through the key index
+            conn.execute("CREATE TEMP TABLE query_keys (key TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO temp.query_keys VALUES (?)", [(k,) for k in keys])
+        return pd.read_sql_query(sql, conn, params=params, parse_dates=["Deadline Date"])
+    finally:
+        conn.close()
+
+def prime_cache():
+    '''
+    Seed the store with demo tenders if it is empty. (Functional Fix)
+    Returns True when it did.
+    '''
+    if store_has_tenders():
+        return False
+    future_date_1 = (datetime.now() + timedelta(days=45)).strftime("%d-%m-%Y")
+    future_date_2 = (datetime.now() + timedelta(days=15)).strftime("%d-%m-%Y")
+    
+    # Dummy data designed to pass the keyword and deadline filters
+    dummy_data = [
+        {
+            "Tender Title": "Supply of Waterproof Primer and High-Grade Emulsion Paint",
+            "Tender Number": "AP/TNDR/001A",
+            "Buyer": "Asian Paints (Demo)",
+            "Deadline": future_date_1,
+            "Doc Link": "", # Empty link for simplicity
+            "Location": "Bengaluru",
+            "Source": "Internal CRM",
+            "Score": 45
+        },
+        {
+            "Tender Title": "Procurement of Electrical Cables and Accessories",
+            "Tender Number": "PSU/ELECT/002B",
+            "Buyer": "BHEL (Demo)",
+            "Deadline": future_date_2,
+            "Doc Link": "",
+            "Location": "Nagpur",
+            "Source": "BHEL Portal",
+            "Score": 95
+        }
+    ]
+    upsert_tenders(dummy_data)
+    return True
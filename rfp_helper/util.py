@@ -0,0 +1,35 @@
+'''Small helpers shared by the pipeline modules.'''
+import multiprocessing
+import os
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+
+def atomic_write(path, data, mode="wb"):
+    '''Write to a temporary file and rename it over `path`, so readers never see a partial file.'''
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, mode) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _apply_config(settings):
+    from . import config
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+
+def process_pool(workers):
+    '''
+    A ProcessPoolExecutor whose workers are spawned, not forked: forking
+    the threaded Streamlit server (or a job worker thread) can copy a lock
+    held by another thread into the child, which then hangs on it. Spawned
+    workers start from a fresh interpreter, so the caller's current config
+    values are copied into each of them.
+    '''
+    from . import config
+    settings = {name: value for name, value in vars(config).items()
+                if not name.startswith("_") and not isinstance(value, types.ModuleType)}
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_apply_config, initargs=(settings,))